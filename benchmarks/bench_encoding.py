@@ -0,0 +1,57 @@
+"""Measure bytes on the wire per request for each content coding pip-ext may negotiate.
+
+    python benchmarks/bench_encoding.py --page project.html   # a saved page, e.g. a long PyPI README
+    python benchmarks/bench_encoding.py --size 2000000       # a synthetic page of that many bytes
+
+The fixture server compresses with the best coding the request offers, so installing the
+`compression` extra (brotli, zstandard) on both sides shows what "br" and "zstd" save.
+"""
+import argparse
+import random
+import time
+
+from fixtures import FixtureServer, html_route
+
+import pip_ext
+
+
+def synthetic_page(size: int, seed: int = 0) -> str:
+    # HTML-like text with the repetition of a real project page.
+    generator = random.Random(seed)
+    words = ["package", "install", "python", "version", "<code>", "</code>", "<p>", "</p>", "dependency", "the",
+             "requests", "import", "def", "return", "class", "<a href=\"https://example.org/\">", "</a>", "\n"]
+    chunks, length = [], 0
+    while length < size:
+        chunk = " ".join(generator.choices(words, k=64)) + f" {generator.random():.6f}\n"
+        chunks.append(chunk)
+        length += len(chunk)
+    return "<html><body>" + "".join(chunks) + "</body></html>"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--page", help="HTML file to serve instead of a synthetic page")
+    parser.add_argument("--size", type=int, default=1000000, help="size of the synthetic page in bytes")
+    parser.add_argument("--requests", type=int, default=20)
+    args = parser.parse_args()
+
+    content = open(args.page, encoding="utf-8").read() if args.page else synthetic_page(args.size)
+    with FixtureServer({"/page/": html_route(content)}, compress=True) as server:
+        pip_ext.HTTP_CACHE = None
+        print(f"{'Accept-Encoding':<28} {'wire bytes/request':>20} {'ratio':>7} {'ms/request':>11}")
+        for accept_encoding in ("identity", "gzip, deflate", pip_ext.ACCEPT_ENCODING):
+            pip_ext.CONNECTION_STATS.clear()
+            headers = {**pip_ext.HEADERS, "Accept-Encoding": accept_encoding}
+            start = time.perf_counter()
+            with pip_ext.make_session(pool_size=1) as session:
+                for _ in range(args.requests):
+                    response = pip_ext.fetch(session, pip_ext.Get(f"{server.url}/page/", headers=headers))
+                    assert response.content.decode("utf-8") == content
+            elapsed = time.perf_counter() - start
+            wire_bytes, body_bytes = pip_ext.CONNECTION_STATS["127.0.0.1"][2:4]
+            print(f"{accept_encoding:<28} {wire_bytes / args.requests:>20.0f} {wire_bytes / body_bytes:>7.3f} "
+                  f"{elapsed / args.requests * 1000:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""Compare the sequential, threaded and asyncio search engines against a local fixture server.
+
+    python benchmarks/bench_engines.py --packages 200 --latency 0.02 --jobs 32
+"""
+import argparse
+import asyncio
+import time
+
+from fixtures import FixtureServer, pypi_routes
+
+import pip_ext
+
+
+def bench(label: str, function, packages: int) -> None:
+    start = time.perf_counter()
+    results = function()
+    elapsed = time.perf_counter() - start
+    assert len(results) == packages and not any(result.startswith("Failed") for result in results), results[:1]
+    print(f"{label:<12} {elapsed:8.3f} s {packages / elapsed:10.1f} lookups/s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--packages", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds added to every response")
+    parser.add_argument("--jobs", type=int, default=32)
+    args = parser.parse_args()
+
+    routes, names = pypi_routes(args.packages)
+    queries = [(name, None) for name in names]
+    with FixtureServer(routes, delay=args.latency) as server:
+        pip_ext.PYPI_URL, pip_ext.HTTP_CACHE = server.url, None
+        for label, jobs in (("sequential", 1), ("threaded", args.jobs)):
+            with pip_ext.make_session(pool_size=jobs) as session:
+                bench(label, lambda: list(pip_ext.search_many(session, queries, jobs=jobs)), args.packages)
+        if pip_ext.aiohttp is not None:
+            bench("asyncio", lambda: asyncio.run(pip_ext.search_many_async(queries, limit=args.jobs)), args.packages)
+        else:
+            print("asyncio      skipped (aiohttp is not installed)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Tail latency of single requests against a fixture server that stalls some of them.
+
+    python benchmarks/bench_latency.py --requests 2000 --latency 0.005 --stalls 0.03 --stall 1.0 --jobs 16
+
+Each request is answered after --latency seconds, or after --stall seconds for a --stalls share
+of them. Requests are sent plainly, with a short read timeout (and retries), and hedged.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fixtures import FixtureServer, pypi_routes
+
+import pip_ext
+
+
+class Stalls:
+    def __init__(self, latency: float, share: float, stall: float, seed: int = 0):
+        self.latency, self.share, self.stall = latency, share, stall
+        self.generator, self.lock = random.Random(seed), threading.Lock()
+
+    def __call__(self, path: str) -> float:
+        with self.lock:
+            return self.stall if self.generator.random() < self.share else self.latency
+
+
+def timed(function, *args) -> float:
+    start = time.perf_counter()
+    try:
+        function(*args)
+    except pip_ext.requests.RequestException:
+        return float("inf")
+    return time.perf_counter() - start
+
+
+def report(label: str, server: FixtureServer, durations: list[float], elapsed: float, requests_before: int) -> None:
+    failed = sum(duration == float("inf") for duration in durations)
+    durations = sorted(duration for duration in durations if duration != float("inf"))
+    p50, p95, p99 = (durations[min(int(len(durations) * q), len(durations) - 1)] * 1000 for q in (0.5, 0.95, 0.99))
+    sent = server.requests - requests_before
+    print(f"{label:<28} {p50:8.1f} {p95:8.1f} {p99:8.1f} {max(durations) * 1000:8.1f} {statistics.fmean(durations) * 1000:8.1f}"
+          f" {sent:7} {failed:6} {elapsed:8.2f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.005, help="seconds before a normal answer")
+    parser.add_argument("--stalls", type=float, default=0.03, help="share of requests that stall")
+    parser.add_argument("--stall", type=float, default=1.0, help="seconds a stalled request takes")
+    parser.add_argument("--timeout", type=float, default=0.1, help="read timeout of the timeout run")
+    parser.add_argument("--jobs", type=int, default=16)
+    args = parser.parse_args()
+
+    routes, names = pypi_routes(args.requests)
+    with FixtureServer(routes, delay=Stalls(args.latency, args.stalls, args.stall)) as server:
+        pip_ext.HTTP_CACHE = None
+        requests = [pip_ext.Get(f"{server.url}/pypi/{name}/json", headers=pip_ext.JSON_HEADERS) for name in names]
+        print(f"{'':<28} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'mean ms':>8} {'sent':>7} {'failed':>6} {'total s':>8}")
+        configurations = (("plain", pip_ext.READ_TIMEOUT, False), (f"read timeout {args.timeout:g} s", args.timeout, False),
+                          ("hedged", pip_ext.READ_TIMEOUT, True))
+        for label, read_timeout, hedge in configurations:
+            pip_ext.READ_TIMEOUT, pip_ext.HEDGE, pip_ext.SCHEDULER = read_timeout, hedge, pip_ext.HostScheduler()
+            requests_before, start = server.requests, time.perf_counter()
+            with pip_ext.make_session(pool_size=args.jobs) as session, ThreadPoolExecutor(args.jobs) as executor:
+                durations = list(executor.map(lambda request: timed(pip_ext.fetch, session, request), requests))
+            report(f"threaded, {label}", server, durations, time.perf_counter() - start, requests_before)
+
+            if pip_ext.aiohttp is None:
+                continue
+            async def fetch_all() -> list[float]:
+                async with pip_ext.make_client(args.jobs) as client:
+                    semaphore = asyncio.Semaphore(args.jobs)
+                    async def timed_async(request) -> float:
+                        async with semaphore:
+                            start = time.perf_counter()
+                            try:
+                                await pip_ext.fetch_async(client, request)
+                            except (pip_ext.requests.RequestException, pip_ext.aiohttp.ClientError, asyncio.TimeoutError):
+                                return float("inf")
+                            return time.perf_counter() - start
+                    return await asyncio.gather(*map(timed_async, requests))
+            pip_ext.SCHEDULER = pip_ext.HostScheduler()
+            requests_before, start = server.requests, time.perf_counter()
+            durations = asyncio.run(fetch_all())
+            report(f"asyncio, {label}", server, durations, time.perf_counter() - start, requests_before)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Micro-benchmarks for project name validation and normalization.
+
+    python benchmarks/bench_names.py --count 500000
+    python benchmarks/bench_names.py --names names.txt   # one project name per line, e.g. from /simple/
+"""
+import argparse
+import random
+import re
+import string
+import time
+
+from fixtures import FixtureServer # noqa: F401 (puts the repository on sys.path)
+
+import pip_ext
+
+LEGACY_NAME = r"[a-zA-Z](?:[a-zA-Z0-9]+|(?:\-|\.[a-zA-Z0-9]+))*"
+
+
+def legacy_is_valid(name: str) -> bool:
+    return bool(re.match(LEGACY_NAME, name))
+
+
+def legacy_normalize(name: str) -> str:
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def synthetic_names(count: int, seed: int = 0) -> list[str]:
+    # Mostly already canonical, as on PyPI, with a share of mixed case and separators
+    # and every name appearing about twice, as in requirement files and lock files.
+    generator = random.Random(seed)
+    alphabet = string.ascii_lowercase + string.digits
+    names = []
+    for _ in range(count // 2):
+        words = ["".join(generator.choices(alphabet, k=generator.randint(2, 9))) for _ in range(generator.randint(1, 3))]
+        if generator.random() < 0.3:
+            name = "".join(word.capitalize() + generator.choice("-_.") for word in words)[:-1]
+        else:
+            name = "-".join(words)
+        names += [name, name]
+    generator.shuffle(names)
+    return names
+
+
+def bench(label: str, function, names: list[str]) -> None:
+    start = time.perf_counter()
+    function(names)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32} {elapsed:8.3f} s {len(names) / elapsed / 1e6:8.2f} M names/s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=500000)
+    parser.add_argument("--names", help="file with one project name per line instead of synthetic names")
+    parser.add_argument("--long", type=int, default=1000000, help="length of the adversarial names")
+    args = parser.parse_args()
+
+    if args.names:
+        with open(args.names, encoding="utf-8") as file:
+            names = [line.strip() for line in file if line.strip()]
+    else:
+        names = synthetic_names(args.count)
+
+    bench("validate (legacy re.match)", lambda names: [legacy_is_valid(name) for name in names], names)
+    bench("validate", lambda names: [pip_ext.is_valid_package_name(name) for name in names], names)
+    disagreements = sum(legacy_is_valid(name) != pip_ext.is_valid_package_name(name) for name in names)
+    print(f"{'':<32} {disagreements} names judged differently")
+
+    bench("normalize (legacy re.sub)", lambda names: [legacy_normalize(name) for name in names], names)
+    pip_ext.normalize_name.cache_clear()
+    bench("normalize_name (cold cache)", lambda names: [pip_ext.normalize_name(name) for name in names], names)
+    bench("normalize_name (warm cache)", lambda names: [pip_ext.normalize_name(name) for name in names], names)
+    bench("normalize_many", pip_ext.normalize_many, names)
+
+    for label, name in (("valid", "a" * args.long), ("separators", "a" + "-." * (args.long // 2) + "a"),
+                        ("invalid at end", "a" + "1" * args.long + "!")):
+        start = time.perf_counter()
+        pip_ext.is_valid_package_name(name)
+        pip_ext.canonical_name(name)
+        print(f"{'long name, ' + label:<32} {time.perf_counter() - start:8.4f} s for {len(name)} characters")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""Parse throughput and peak memory of the project page parsers over a corpus of pages.
+
+    python benchmarks/bench_parsers.py                      # pages in data/pages, or the synthetic corpus
+    python benchmarks/bench_parsers.py --synthetic --json results.json
+    python benchmarks/bench_parsers.py --record six boto3   # save the PyPI and Snyk pages of projects
+
+Saved pages live in data/pages/pypi/<project>.html.gz and data/pages/snyk/<project>.html.gz.
+The synthetic corpus is generated from a fixed seed, from a small project to one with a
+multi-megabyte README and thousands of releases, so results can be compared across commits.
+PyPI pages are parsed the way lookups do ("lookup": fed 16 KiB chunks until the parser has
+what it needs) and whole ("full"); Snyk pages are always parsed whole.
+"""
+import argparse
+import codecs
+import gzip
+import json
+import pathlib
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+
+from fixtures import FixtureServer # noqa: F401 (puts the repository on sys.path)
+
+import pip_ext
+
+PAGES_DIR = pathlib.Path(__file__).resolve().parent / "data" / "pages"
+
+# name: (README bytes, releases, Snyk versions)
+SYNTHETIC = {"small": (2_000, 10, 10), "medium": (40_000, 100, 100),
+             "large": (400_000, 1_000, 1_000), "huge": (4_000_000, 5_000, 5_000)}
+
+WORDS = ["the", "package", "install", "python", "version", "dependency", "import", "return", "configuration",
+         "example", "requests", "session", "release", "support", "documentation", "module", "function"]
+
+
+def prose(generator: random.Random, size: int) -> str:
+    # README-like HTML: paragraphs, code blocks and links, as rendered by PyPI.
+    parts, length = [], 0
+    while length < size:
+        kind = generator.random()
+        if kind < 0.7:
+            part = "<p>" + " ".join(generator.choices(WORDS, k=generator.randint(20, 80))) + ".</p>\n"
+        elif kind < 0.9:
+            lines = (f"    {generator.choice(WORDS)} = {generator.choice(WORDS)}({generator.randint(0, 99)})" for _ in range(8))
+            part = "<pre><span class=\"n\">" + "</span>\n<span class=\"n\">".join(lines) + "</span></pre>\n"
+        else:
+            part = f"<ul><li><a href=\"https://example.org/{generator.choice(WORDS)}\" rel=\"nofollow\">{generator.choice(WORDS)}</a></li></ul>\n"
+        parts.append(part)
+        length += len(part)
+    return "".join(parts)
+
+
+def pypi_page(name: str, readme_size: int, releases: int, seed: int = 0) -> str:
+    generator = random.Random(seed)
+    navigation = "".join(f"<li><a href=\"/{word}/\" class=\"horizontal-menu__link\">{word.title()}</a></li>\n" for word in WORDS * 8)
+    links = "".join(f"<li><a class=\"vertical-tabs__tab vertical-tabs__tab--with-icon\" href=\"https://example.org/{name}/{label.lower()}\""
+                    f" rel=\"nofollow\"><i class=\"fas fa-link\" aria-hidden=\"true\"></i>{label}</a></li>\n"
+                    for label in ("Homepage", "Documentation", "Source", "Changelog"))
+    history = "".join(f"<div class=\"release\"><a class=\"card release__card\" href=\"/project/{name}/{index // 100}.{index % 100}/\">"
+                      f"<p class=\"release__version\">{index // 100}.{index % 100}</p><p class=\"release__version-date\">"
+                      f"<time datetime=\"2020-01-01T00:00:00+0000\">Jan 1, 2020</time></p></a></div>\n"
+                      for index in range(releases, 0, -1))
+    return f"""<!DOCTYPE html>
+<html lang="en" dir="ltr">
+<head><meta charset="utf-8"><title>{name} · PyPI</title>
+<link rel="stylesheet" href="/static/css/warehouse-ltr.css"><script async src="/static/js/warehouse.js"></script></head>
+<body data-controller="viewport-toggle">
+<header class="site-header"><nav><ul class="horizontal-menu">{navigation}</ul></nav></header>
+<main id="content">
+<div class="banner"><div class="package-header">
+<h1 class="package-header__name">
+  {name} 1.0.0
+</h1>
+<p class="package-header__date">Released: <time datetime="2024-01-01T00:00:00+0000">Jan 1, 2024</time></p>
+</div></div>
+<div class="package-description"><p class="package-description__summary">The {name} package for benchmarks.</p></div>
+<div class="vertical-tabs"><div class="vertical-tabs__tabs">
+<div class="sidebar-section"><h3 class="sidebar-section__title">Project links</h3>
+<ul class="vertical-tabs__list">
+{links}</ul></div>
+<div class="sidebar-section"><h3 class="sidebar-section__title">Meta</h3>
+<p><strong>License:</strong> MIT License</p>
+<p><strong>Author:</strong> <a href="mailto:author@example.org">Fixture Author</a></p>
+<p><strong>Requires:</strong> Python &gt;=3.8</p>
+</div></div>
+<div class="vertical-tabs__panel">
+<div id="description" class="vertical-tabs__content"><h2 class="page-title">Project description</h2>
+<div class="project-description">
+{prose(generator, readme_size)}</div></div>
+<div id="history" class="vertical-tabs__content"><h2 class="page-title">Release history</h2>
+<div class="release-timeline">
+{history}</div></div>
+</div></div>
+</main></body></html>
+"""
+
+
+def snyk_page(name: str, versions: int, seed: int = 0) -> str:
+    generator = random.Random(seed)
+    scores = "".join(f"<li><span class=\"title\">{title}</span><span class=\"value\">{generator.randint(1, 999)}</span></li>\n"
+                     for title in ("Popularity", "GitHub Stars", "Forks", "Maintenance", "Open Issues", "Open PR",
+                                   "Last Release", "Last Commit", "Security", "License", "Security Policy", "Community",
+                                   "Readme", "Contributing.md", "Code of Conduct", "Contributors", "Funding",
+                                   "Python Versions Compatibility", "Age", "Dependencies", "Versions", "Maintainers", "Wheels"))
+    rows = "".join(f"<tr><td><a href=\"/advisor/python/{name}/{index // 100}.{index % 100}\">{index // 100}.{index % 100}</a></td>"
+                   f"<td>{generator.randint(0, 9)} vulnerabilities</td><td>2020-01-01</td></tr>\n" for index in range(versions, 0, -1))
+    return f"""<!DOCTYPE html>
+<html lang="en"><head><meta charset="utf-8"><title>{name} - Python Package Health Analysis | Snyk</title></head>
+<body><div id="__nuxt"><div class="package-page">
+<h1 class="package-name">{name}</h1>
+<div class="health"><span>Package Health Score</span><span>{generator.randint(40, 99)} / 100</span></div>
+<div class="latest"><span>1.0.0</span><span>(Latest)</span></div>
+<ul class="scores">
+{scores}</ul>
+<div class="readme">{prose(generator, versions * 40)}</div>
+<table class="versions"><tbody>
+{rows}</tbody></table>
+</div></div></body></html>
+"""
+
+
+def synthetic_corpus() -> list[tuple[str, str, bytes]]:
+    corpus = []
+    for seed, (label, (readme_size, releases, versions)) in enumerate(SYNTHETIC.items()):
+        corpus.append(("pypi", f"synthetic-{label}", pypi_page(f"synthetic-{label}", readme_size, releases, seed).encode()))
+        corpus.append(("snyk", f"synthetic-{label}", snyk_page(f"synthetic-{label}", versions, seed).encode()))
+    return corpus
+
+
+def saved_corpus(directory: pathlib.Path) -> list[tuple[str, str, bytes]]:
+    corpus = []
+    for kind in ("pypi", "snyk"):
+        for path in sorted((directory / kind).glob("*.html*")):
+            content = gzip.decompress(path.read_bytes()) if path.suffix == ".gz" else path.read_bytes()
+            corpus.append((kind, path.name.split(".html")[0], content))
+    return corpus
+
+
+def record(names: list[str]) -> None:
+    with pip_ext.make_session() as session:
+        for name in names:
+            for kind, url in (("pypi", f"https://pypi.org/project/{name}/"), ("snyk", f"https://snyk.io/advisor/python/{name}")):
+                try:
+                    response = pip_ext.fetch(session, pip_ext.Get(url))
+                    response.raise_for_status()
+                except pip_ext.requests.RequestException as exception:
+                    print(f"warning: {url} was not saved: {exception}")
+                    continue
+                path = PAGES_DIR / kind / f"{name}.html.gz"
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_bytes(gzip.compress(response.content, mtime=0))
+                print(f"Saved {len(response.content)} bytes to {path}")
+
+
+def parse_lookup(content: bytes) -> tuple[int, object]:
+    # As fetch_package_html_steps does: decode and feed chunk by chunk, stop once done.
+    parser = pip_ext.PyPIPackageHTMLParser()
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    consumed = 0
+    for start in range(0, len(content), pip_ext.STREAM_CHUNK_SIZE):
+        chunk = content[start:start + pip_ext.STREAM_CHUNK_SIZE]
+        consumed += len(chunk)
+        parser.feed(decoder.decode(chunk))
+        if parser.done:
+            break
+    return consumed, parser.package
+
+
+def parse_full(parser_class):
+    def parse(content: bytes) -> tuple[int, object]:
+        parser = parser_class()
+        parser.feed(content.decode("utf-8", errors="replace"))
+        parser.close()
+        return len(content), getattr(parser, "package", None) or getattr(parser, "package_health", None)
+    return parse
+
+
+PARSERS = {"pypi": (("lookup", parse_lookup), ("full", parse_full(pip_ext.PyPIPackageHTMLParser))),
+           "snyk": (("full", parse_full(pip_ext.SnykAdvisorHTMLParser)),)}
+
+
+def measure(parse, content: bytes, repeat: int, min_time: float) -> dict:
+    # Best of `repeat` rounds, each parsing the page as often as fits in `min_time` (at least once).
+    best = float("inf")
+    for _ in range(repeat):
+        rounds, start = 0, time.perf_counter()
+        while True:
+            consumed, result = parse(content)
+            rounds += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+        best = min(best, elapsed / rounds)
+    tracemalloc.start()
+    parse(content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"bytes": len(content), "parsed": consumed, "seconds": best, "mb_per_s": consumed / best / 1e6,
+            "pages_per_s": 1 / best, "peak_kib": peak / 1024, "fields": len(result or ())}
+
+
+def revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PAGES_DIR.parent, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", type=pathlib.Path, default=PAGES_DIR, help="directory with pypi/ and snyk/ pages")
+    parser.add_argument("--synthetic", action="store_true", help="use the generated corpus even if pages were saved")
+    parser.add_argument("--repeat", type=int, default=5, help="rounds per page, the fastest counts")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds each round runs at least")
+    parser.add_argument("--json", type=pathlib.Path, metavar="FILE", help="also write the results to FILE")
+    parser.add_argument("--record", nargs="+", metavar="PROJECT", help="save the pages of PROJECTs to data/pages instead")
+    args = parser.parse_args()
+
+    if args.record:
+        return record(args.record)
+
+    corpus = [] if args.synthetic else saved_corpus(args.corpus)
+    corpus = corpus or synthetic_corpus()
+    print(f"{'page':<32} {'mode':<7} {'KiB':>9} {'parsed':>9} {'ms':>9} {'MB/s':>7} {'pages/s':>9} {'peak KiB':>9} {'fields':>6}")
+    results = []
+    for kind, name, content in corpus:
+        for mode, parse in PARSERS[kind]:
+            result = measure(parse, content, args.repeat, args.min_time)
+            results.append({"kind": kind, "page": name, "mode": mode, **result})
+            print(f"{f'{kind}/{name}':<32} {mode:<7} {len(content) / 1024:>9.1f} {result['parsed'] / 1024:>9.1f}"
+                  f" {result['seconds'] * 1000:>9.2f} {result['mb_per_s']:>7.1f} {result['pages_per_s']:>9.1f}"
+                  f" {result['peak_kib']:>9.1f} {result['fields']:>6}")
+    for kind, mode in sorted({(result["kind"], result["mode"]) for result in results}):
+        selected = [result for result in results if (result["kind"], result["mode"]) == (kind, mode)]
+        parsed, seconds = sum(result["parsed"] for result in selected), sum(result["seconds"] for result in selected)
+        print(f"{f'{kind} total':<32} {mode:<7} {'':>9} {parsed / 1024:>9.1f} {seconds * 1000:>9.2f} {parsed / seconds / 1e6:>7.1f}"
+              f" {len(selected) / seconds:>9.1f}")
+    if args.json:
+        args.json.write_text(json.dumps({"revision": revision(), "python": platform.python_version(),
+                                         "results": results}, indent=1) + "\n", encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Record a dependency tree and a batch of searches from the fixture server, then replay them
+offline with simulated latency at several concurrency levels.
+
+    python benchmarks/bench_replay.py --latency 0.02 --jobs 1 8 32
+    python benchmarks/bench_replay.py --archive jupyter.jsonl   # keep the archive for `pip-ext --replay`
+
+Replayed runs must produce exactly what the recorded run did, the rest is timing.
+"""
+import argparse
+import json
+import pathlib
+import tempfile
+import time
+
+from bench_tree import DATA_DIR, tree_routes
+from fixtures import FixtureServer, pypi_routes
+
+import pip_ext
+
+
+def run_tree(root: str, jobs: int) -> str:
+    pip_ext.MAX_BATCH_WORKERS = jobs
+    with pip_ext.make_session(pool_size=jobs) as session:
+        return json.dumps(pip_ext.run_steps(session, pip_ext.dependency_tree_steps(root)), sort_keys=True)
+
+
+def run_search(queries: list, jobs: int) -> str:
+    with pip_ext.make_session(pool_size=jobs) as session:
+        return "\n---\n".join(pip_ext.search_many(session, queries, jobs=jobs))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fixture", default="jupyter", help="recorded tree to serve, from data/tree-<name>.json")
+    parser.add_argument("--packages", type=int, default=200, help="packages in the batch of searches")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds added to every replayed response")
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--archive", type=pathlib.Path, help="where to keep the archive (default: a temporary file)")
+    args = parser.parse_args()
+
+    fixture = json.loads((DATA_DIR / f"tree-{args.fixture}.json").read_text(encoding="utf-8"))
+    routes, names = pypi_routes(args.packages)
+    queries = [(name, None) for name in names]
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.archive or pathlib.Path(directory) / "archive.jsonl"
+        pip_ext.HTTP_CACHE, pip_ext.INDEX_PATH = None, DATA_DIR / "missing.sqlite3"
+        pip_ext.TAG_INDEX_DIR = pip_ext.METADATA_INDEX_PATH = None
+
+        with FixtureServer(routes) as server:
+            server.routes.update(tree_routes(fixture, server.url))
+            pip_ext.PYPI_URL, pip_ext.ARCHIVE = server.url, pip_ext.FixtureArchive(path, replaying=False)
+            start = time.perf_counter()
+            expected = {"tree": run_tree(fixture["root"], max(args.jobs)), "search": run_search(queries, max(args.jobs))}
+            print(f"recorded {server.requests} responses ({path.stat().st_size / 1024:.0f} KiB) in {time.perf_counter() - start:.3f} s")
+
+        # The server is gone: every response now comes from the archive.
+        pip_ext.ARCHIVE = pip_ext.FixtureArchive(path, replaying=True, latency={"*": args.latency})
+        for label, run in (("tree", lambda jobs: run_tree(fixture["root"], jobs)), ("search", lambda jobs: run_search(queries, jobs))):
+            for jobs in args.jobs:
+                pip_ext.SCHEDULER = pip_ext.HostScheduler()
+                start = time.perf_counter()
+                result = run(jobs)
+                elapsed = time.perf_counter() - start
+                print(f"replay {label:<7} {jobs:3} jobs {elapsed:8.3f} s  {'identical' if result == expected[label] else 'DIFFERENT'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Time setup.py dependency extraction on adversarial inputs of growing size.
+
+    python benchmarks/bench_setup_py.py --sizes 1000 10000 100000 1000000 --timeout 5
+
+The regular expression the extraction used to rely on is run alongside in a child
+process (its time includes interpreter start-up), which is killed after --timeout seconds.
+"""
+import argparse
+import subprocess
+import sys
+import time
+
+from fixtures import FixtureServer # noqa: F401 (puts the repository on sys.path)
+
+import pip_ext
+
+LEGACY_DEPENDENCIES = r"(?:(?:install_requires|requires)\s*?=\s*?\[(?P<deps>(\s*.*?)+)\])"
+
+
+def unclosed(size: int) -> str:
+    # A list that is never closed: every line can be split between the nested quantifiers.
+    return "install_requires = [\n" + "    'package>=1.0',\n" * (size // 21)
+
+
+def large(size: int) -> str:
+    entries = "".join(f"    'package-{index}>=1.0',\n" for index in range(size // 24))
+    return f"from setuptools import setup\n\nsetup(\n  name='large',\n  install_requires=[\n{entries}  ],\n)\n"
+
+
+def nested(size: int) -> str:
+    return "install_requires = " + "[" * (size // 2) + "]" * (size // 2) + "\n"
+
+
+def long_line(size: int) -> str:
+    return "setup(install_requires=['" + "a" * size + "'])\n"
+
+
+def many_calls(size: int) -> str:
+    return "setup(install_requires=['a'], extras_require={'x': ['b']})\n" * (size // 60)
+
+
+INPUTS = {"unclosed": unclosed, "large": large, "nested": nested, "long-line": long_line, "many-calls": many_calls}
+
+
+def time_legacy(content: str, timeout: float) -> str:
+    code = "import re, sys; re.search(sys.argv[1], sys.stdin.read())"
+    start = time.perf_counter()
+    try:
+        subprocess.run([sys.executable, "-c", code, LEGACY_DEPENDENCIES], input=content, text=True, timeout=timeout, check=True)
+    except subprocess.TimeoutExpired:
+        return f"> {timeout:.0f} s"
+    return f"{time.perf_counter() - start:.3f} s"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000], help="input sizes in bytes")
+    parser.add_argument("--timeout", type=float, default=5.0, help="seconds the legacy regex may run")
+    parser.add_argument("--no-legacy", dest="legacy", action="store_false", help="only time the ast extraction")
+    args = parser.parse_args()
+
+    print(f"{'input':<12} {'bytes':>9} {'ast':>10} {'MB/s':>8} {'found':>7} {'legacy regex':>14}")
+    for label, make in INPUTS.items():
+        for size in args.sizes:
+            content = make(size)
+            start = time.perf_counter()
+            dependencies, _ = pip_ext.setup_py_dependencies(content)
+            elapsed = time.perf_counter() - start
+            legacy = time_legacy(content, args.timeout) if args.legacy else "-"
+            print(f"{label:<12} {len(content):>9} {elapsed:>8.4f} s {len(content) / elapsed / 1e6:>8.1f} {len(dependencies):>7} {legacy:>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Search against a fixture server that throttles like PyPI does, with and without retries
+and with the client's own rate limit for the host set just below the server's.
+
+    python benchmarks/bench_throttling.py --packages 200 --rate 100 --errors 0.05 --jobs 32
+
+The server admits --rate requests per second (with a burst of as many) and answers the rest
+with 429 and a Retry-After header; --errors of the admitted requests fail with a 503.
+"""
+import argparse
+import asyncio
+import random
+import threading
+import time
+
+from fixtures import FixtureServer, html_route, pypi_routes
+
+import pip_ext
+
+
+class Throttle:
+    def __init__(self, rate: float, errors: float, retry_after: str, seed: int = 0):
+        self.rate, self.errors, self.retry_after = rate, errors, retry_after
+        self.tokens, self.updated = rate, time.monotonic()
+        self.generator, self.lock = random.Random(seed), threading.Lock()
+        self.throttled = self.failed = 0
+
+    def __call__(self, path: str):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                self.throttled += 1
+                status, headers, body = html_route("<html><body>Too Many Requests</body></html>", 429)
+                return status, {**headers, "Retry-After": self.retry_after}, body
+            self.tokens -= 1
+            if self.generator.random() < self.errors:
+                self.failed += 1
+                return html_route("<html><body>Service Unavailable</body></html>", 503)
+        return None
+
+
+def bench(label: str, function, throttle: Throttle, packages: int) -> None:
+    throttle.throttled = throttle.failed = 0
+    pip_ext.CONNECTION_STATS.clear()
+    pip_ext.SCHEDULER = pip_ext.HostScheduler()
+    start = time.perf_counter()
+    results = function()
+    elapsed = time.perf_counter() - start
+    succeeded = sum(result.startswith("Name: ") for result in results) # not "Failed ..." nor "No such project ..."
+    retries = sum(stats[4] for stats in pip_ext.CONNECTION_STATS.values())
+    print(f"{label:<24} {elapsed:8.3f} s {succeeded:6}/{packages} found {throttle.throttled:6} throttled "
+          f"{throttle.failed:5} failed {retries:6} retried")
+    for line in pip_ext.SCHEDULER.report():
+        print(f"    {line}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--packages", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=100.0, help="requests per second the server admits")
+    parser.add_argument("--errors", type=float, default=0.05, help="share of admitted requests answered with 503")
+    parser.add_argument("--retry-after", default="1", help="Retry-After sent with 429 answers, or '' for none")
+    parser.add_argument("--jobs", type=int, default=32)
+    args = parser.parse_args()
+
+    routes, names = pypi_routes(args.packages)
+    queries = [(name, None) for name in names]
+    throttle = Throttle(args.rate, args.errors, args.retry_after)
+    with FixtureServer(routes, reject=throttle) as server:
+        pip_ext.PYPI_URL, pip_ext.HTTP_CACHE = server.url, None
+        host = server.url.removeprefix("http://")
+        for label, retries, rate in (("0 retries", 0, None), (f"{pip_ext.MAX_RETRIES} retries", pip_ext.MAX_RETRIES, None),
+                                     ("host rate", pip_ext.MAX_RETRIES, args.rate * 0.9)):
+            pip_ext.MAX_RETRIES = retries
+            pip_ext.HOST_RATES.pop(host, None)
+            if rate:
+                pip_ext.HOST_RATES[host] = rate
+            time.sleep(1) # let the bucket fill up again
+            with pip_ext.make_session(pool_size=args.jobs) as session:
+                bench(f"threaded, {label}", lambda: list(pip_ext.search_many(session, queries, jobs=args.jobs)),
+                      throttle, args.packages)
+            if pip_ext.aiohttp is not None:
+                time.sleep(1)
+                bench(f"asyncio, {label}", lambda: asyncio.run(pip_ext.search_many_async(queries, limit=args.jobs)),
+                      throttle, args.packages)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Build a large dependency tree (jupyter's) from a recorded fixture served locally.
+
+    python benchmarks/bench_tree.py --latency 0.02 --jobs 32
+    python benchmarks/bench_tree.py --record jupyter   # refresh data/tree-jupyter.json from PyPI
+
+The fixture keeps, for every project in the tree, the version that was picked and its
+Requires-Dist lines; it is replayed as PEP 691 project pages with PEP 658 metadata files.
+"""
+import argparse
+import asyncio
+import json
+import pathlib
+import time
+
+from fixtures import FixtureServer, html_route, json_route
+
+import pip_ext
+
+DATA_DIR = pathlib.Path(__file__).resolve().parent / "data"
+
+
+def tree_nodes(node: dict):
+    yield node
+    for child in node.get("dependencies", ()):
+        yield from tree_nodes(child)
+
+
+def requires_dist(dependencies: set, optional_dependencies: set | None) -> list[str]:
+    lines = sorted(dependencies)
+    for extra, requirements in sorted(optional_dependencies or ()):
+        for line in requirements:
+            requirement, _, marker = (part.strip() for part in line.partition(";"))
+            lines.append(f"{requirement}; ({marker}) and extra == \"{extra}\"" if marker else f"{requirement}; extra == \"{extra}\"")
+    return lines
+
+
+def record(root: str) -> None:
+    with pip_ext.make_session(pool_size=16) as session:
+        tree = pip_ext.run_steps(session, pip_ext.dependency_tree_steps(root))
+        projects = {}
+        for node in tree_nodes(tree):
+            if node["version"] is None:
+                print(f"warning: {node['requirement']} was not resolved and is left out")
+                continue
+            versions = projects.setdefault(pip_ext.normalize_name(node["name"]), {})
+            if node["version"] not in versions:
+                dependencies, optional_dependencies = pip_ext.run_steps(
+                    session, pip_ext.search_dependencies_steps({"Name": node["name"]}, node["version"]))
+                versions[node["version"]] = requires_dist(dependencies or set(), optional_dependencies)
+    path = DATA_DIR / f"tree-{pip_ext.normalize_name(root)}.json"
+    path.parent.mkdir(exist_ok=True)
+    path.write_text(json.dumps({"root": root, "projects": projects}, indent=1, sort_keys=True) + "\n", encoding="utf-8")
+    print(f"Recorded {len(projects)} projects to {path}")
+
+
+def tree_routes(fixture: dict, url: str) -> dict:
+    routes = {"/search/": html_route("<html><body>No results</body></html>")}
+    for name, versions in fixture["projects"].items():
+        files = []
+        for version, lines in versions.items():
+            filename = f"{name.replace('-', '_')}-{version}-py3-none-any.whl"
+            files.append({"filename": filename, "url": f"{url}/files/{filename}", "hashes": {}, "core-metadata": True})
+            metadata = [f"Metadata-Version: 2.1", f"Name: {name}", f"Version: {version}"]
+            metadata += [f"Requires-Dist: {line}" for line in lines]
+            routes[f"/files/{filename}.metadata"] = 200, {"Content-Type": "text/plain"}, "\n".join(metadata).encode() + b"\n"
+        status, headers, body = json_route({"meta": {"api-version": "1.1"}, "name": name, "files": files, "versions": list(versions)})
+        routes[f"/simple/{name}/"] = status, {"Content-Type": "application/vnd.pypi.simple.v1+json"}, body
+    return routes
+
+
+def bench(label: str, server: FixtureServer, function) -> None:
+    requests_before = server.requests
+    start = time.perf_counter()
+    tree = function()
+    elapsed = time.perf_counter() - start
+    nodes = list(tree_nodes(tree))
+    assert not any(node.get("unresolved") for node in nodes), "the fixture does not match the tree"
+    distinct = len({(node["name"], node["version"]) for node in nodes})
+    print(f"{label:<12} {elapsed:8.3f} s {len(nodes):6} nodes {distinct:5} distinct {server.requests - requests_before:6} requests")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fixture", default="jupyter", help="recorded tree to replay, from data/tree-<name>.json")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds added to every response")
+    parser.add_argument("--jobs", type=int, default=32)
+    parser.add_argument("--record", metavar="PROJECT", help="record the tree of PROJECT from PyPI instead")
+    args = parser.parse_args()
+
+    if args.record:
+        return record(args.record)
+
+    fixture = json.loads((DATA_DIR / f"tree-{args.fixture}.json").read_text(encoding="utf-8"))
+    with FixtureServer({}, delay=args.latency) as server:
+        server.routes.update(tree_routes(fixture, server.url))
+        pip_ext.PYPI_URL, pip_ext.HTTP_CACHE, pip_ext.INDEX_PATH = server.url, None, DATA_DIR / "missing.sqlite3"
+        for label, workers in (("sequential", 1), ("threaded", args.jobs)):
+            pip_ext.MAX_BATCH_WORKERS = workers
+            with pip_ext.make_session(pool_size=workers) as session:
+                bench(label, server, lambda: pip_ext.run_steps(session, pip_ext.dependency_tree_steps(fixture["root"])))
+        if pip_ext.aiohttp is not None:
+            async def tree_async() -> dict:
+                async with pip_ext.make_client(args.jobs) as client:
+                    return await pip_ext.run_steps_async(client, pip_ext.dependency_tree_steps(fixture["root"]))
+            bench("asyncio", server, lambda: asyncio.run(tree_async()))
+        else:
+            print("asyncio      skipped (aiohttp is not installed)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import http.server
+import json
+import pathlib
+import re
+import sys
+import threading
+import time
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+
+class FixtureHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests += 1
+        self.server.paths.append(self.path)
+        if self.server.delay:
+            time.sleep(self.server.delay(self.path) if callable(self.server.delay) else self.server.delay)
+        path = self.path.split("?", 1)[0]
+        status, headers, body = (self.server.reject and self.server.reject(path)) or \
+                                self.server.routes.get(path, (404, {"Content-Type": "text/html"}, b"Not Found"))
+        if status == 200 and not_modified(headers, self.headers):
+            status, body = 304, b""
+        elif self.server.ranges and status == 200 and (match := RANGE.fullmatch(self.headers.get("Range", ""))):
+            status, headers, body = byte_range(headers, body, *match.groups())
+        if self.server.compress and status == 200 and "Content-Encoding" not in headers:
+            coding, body = encode(body, self.headers.get("Accept-Encoding", ""))
+            headers = {**headers, "Content-Encoding": coding} if coding else headers
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+RANGE = re.compile(r"bytes=(\d*)-(\d*)")
+
+
+def not_modified(headers: dict, request_headers) -> bool:
+    # Routes that carry validators answer conditional requests as RFC 9110 has it: If-None-Match
+    # wins over If-Modified-Since, which only exact dates match here.
+    if "If-None-Match" in request_headers:
+        return "ETag" in headers and headers["ETag"] in (tag.strip() for tag in request_headers["If-None-Match"].split(","))
+    return "Last-Modified" in headers and request_headers.get("If-Modified-Since") == headers["Last-Modified"]
+
+
+def byte_range(headers: dict, body: bytes, first: str, last: str) -> tuple:
+    # A single range as RFC 9110 serves it: a suffix range longer than the body is the whole body.
+    if first:
+        start, end = int(first), min(int(last), len(body) - 1) if last else len(body) - 1
+    elif last:
+        start, end = max(0, len(body) - int(last)), len(body) - 1
+    else:
+        return 200, headers, body
+    if start > end:
+        return 416, {"Content-Range": f"bytes */{len(body)}"}, b""
+    return 206, {**headers, "Content-Range": f"bytes {start}-{end}/{len(body)}"}, body[start:end + 1]
+
+
+def encode(body: bytes, accept_encoding: str) -> tuple[str | None, bytes]:
+    # The best coding the client offers and this server can produce, as CDNs pick them.
+    offered = {coding.split(";")[0].strip().lower() for coding in accept_encoding.split(",")}
+    if "zstd" in offered and zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor().compress(body)
+    if "br" in offered and brotli is not None:
+        return "br", brotli.compress(body)
+    if "gzip" in offered:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        return "gzip", compressor.compress(body) + compressor.flush()
+    if "deflate" in offered:
+        return "deflate", zlib.compress(body)
+    return None, body
+
+
+class FixtureServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, routes: dict, delay=0.0, compress: bool = False, reject=None, ranges: bool = True):
+        # `reject(path)` may return a (status, headers, body) answer to send instead of the route's;
+        # without `ranges` the Range header is ignored and the whole body is sent.
+        super().__init__(("127.0.0.1", 0), FixtureHandler)
+        self.routes, self.delay, self.compress, self.reject, self.requests = routes, delay, compress, reject, 0
+        self.ranges = ranges
+        self.paths = [] # requested in order, with their query strings
+        self.url = f"http://127.0.0.1:{self.server_address[1]}"
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError): # clients hanging up on idle connections
+            super().handle_error(request, client_address)
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+
+def json_route(data) -> tuple:
+    return 200, {"Content-Type": "application/json"}, json.dumps(data).encode()
+
+
+def html_route(content: str, status: int = 200) -> tuple:
+    return status, {"Content-Type": "text/html; charset=utf-8"}, content.encode()
+
+
+def pypi_routes(count: int) -> tuple[dict, list[str]]:
+    routes, names = {}, [f"package-{index}" for index in range(count)]
+    routes["/search/"] = html_route("<html><body>No results</body></html>")
+    for name in names:
+        routes[f"/pypi/{name}/json"] = json_route({
+            "info": {"name": name, "version": "1.0.0", "summary": f"The {name} package.",
+                     "license": "MIT", "author": "Fixture", "author_email": "fixture@example.org",
+                     "requires_python": ">=3.8", "home_page": "", "classifiers": [],
+                     "project_urls": {"Homepage": f"https://example.org/{name}"}},
+            "urls": [],
+        })
+    return routes, names
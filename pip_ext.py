@@ -1,23 +1,68 @@
 import argparse
+import array
+import ast
+import asyncio
+import base64
+import codecs
+import collections
 import configparser
+import contextlib
+import contextvars
+import difflib
+import email.parser
+import email.utils
+import functools
+import hashlib
+import http
+import io
+import itertools
+import json
+import math
+import os
 import pathlib
+import random
 import re
+import sqlite3
+import string
+import struct
+import sys
+import threading
+import time
+import tokenize
 import tomllib
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait as wait_futures
 from html.parser import HTMLParser
-from packaging.requirements import Requirement
-from urllib.parse import urlparse
+from packaging.requirements import InvalidRequirement, Requirement
+from packaging.specifiers import InvalidSpecifier, SpecifierSet
+from packaging.utils import canonicalize_version, parse_sdist_filename, parse_wheel_filename
+from packaging.version import InvalidVersion, Version
+from typing import Callable, NamedTuple
+from urllib.parse import urlencode, urljoin, urlparse
 
 import importlib.resources
 import importlib.metadata
 import importlib.abc
 import requests
+import requests.adapters
+import requests.structures
+import requests.utils
 
+try:
+    import aiohttp
+except ImportError: # optional, only needed by the asyncio engine
+    aiohttp = None
+
+
+# Only the content codings urllib3 can decode here are advertised: "br" needs brotli and
+# "zstd" zstandard (pip install 'pip-ext[compression]'), gzip and deflate always work.
+ACCEPT_ENCODING = requests.utils.DEFAULT_ACCEPT_ENCODING
 
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Linux; x86)",
     "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/png,image/svg+xml,*/*;q=0.8",
     "Accept-Language": "en-US,en;q=0.5",
-    "Accept-Encoding": "gzip, deflate, br, zstd",
+    "Accept-Encoding": ACCEPT_ENCODING,
     "DNT": "1",
     "Sec-GPC": "1",
     "Upgrade-Insecure-Requests": "1",
@@ -27,25 +72,297 @@ HEADERS = {
     "Priority": "u=0, i",
     "TE": "trailers",
 }
+JSON_HEADERS = {**HEADERS, "Accept": "application/json"}
+SIMPLE_HEADERS = {**HEADERS, "Accept": "application/vnd.pypi.simple.v1+json, text/html;q=0.1"}
+GIT_HEADERS = {"User-Agent": "git/2.0 (pip-ext)", "Accept": "application/x-git-upload-pack-advertisement"}
+FILE_HEADERS = {"User-Agent": HEADERS["User-Agent"], "Accept": "*/*", "Accept-Encoding": "identity"} # raw distribution bytes
+
+PYPI_URL = "https://pypi.org"
+
+STREAM_CHUNK_SIZE = 16 * 1024
+MAX_BATCH_WORKERS = 16 # threads fetching one batch of requests on the blocking engine
+POOL_HOSTS = 16 # hosts a session keeps connection pools for
+POOL_SIZE: int | None = None # connections kept per host; by default each command's concurrency
+HOST_LIMITS: dict[str, int] = {} # hard caps on the connections open to a host at once
+HOST_RATES: dict[str, float] = {} # requests per second a host is sent at most
+HOST_CONCURRENCY = 64 # ceiling of a host's adaptive window when it has no entry in HOST_LIMITS
+INITIAL_CONCURRENCY = 4 # requests in flight to a host before anything is known about it
+LATENCY_TOLERANCE = 3.0 # answers this many times slower than the host's fastest stop its window growing
+CONNECTION_STATS = collections.defaultdict(lambda: [0, 0, 0, 0, 0]) # host -> [requests, connections, wire bytes, body bytes, retries]
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504}) # throttling and transient server errors
+MAX_RETRIES = 4
+BACKOFF_BASE, BACKOFF_CAP = 0.5, 20.0 # seconds
+MAX_RETRY_AFTER = 60.0 # a server asking to wait longer gets its error back instead
+CONNECT_TIMEOUT, READ_TIMEOUT = 10.0, 30.0 # seconds per attempt, the read timeout between two bytes
+DEADLINE: float | None = None # time.monotonic() after which a command sends no more requests
+HEDGE = False # send a second copy of requests that take longer than usual to answer
+HEDGE_PERCENTILE, HEDGE_MIN_SAMPLES = 0.95, 20 # "usual" for a host, once this many answers came
+HEDGE_WORKERS = 64 # threads sending hedged requests on the blocking engine
+STATS_LOCK = threading.Lock()
+TRACE: "Trace | None" = None # spans of fetches and parses, recorded with --trace
+ARCHIVE: "FixtureArchive | None" = None # responses recorded with --record, or served with --replay
+
+CACHE_DIR = pathlib.Path(os.environ.get("PIP_EXT_CACHE_DIR") or
+                         pathlib.Path(os.environ.get("XDG_CACHE_HOME") or pathlib.Path.home() / ".cache") / "pip-ext")
+INDEX_PATH = CACHE_DIR / "index.sqlite3"
+TAG_INDEX_DIR: pathlib.Path | None = CACHE_DIR / "tags"
+METADATA_INDEX_PATH: pathlib.Path | None = CACHE_DIR / "metadata.jsonl"
+PYTHON_VERSION = ".".join(map(str, sys.version_info[:3]))
+INDEX_MAX_AGE = 7 * 24 * 60 * 60 # seconds before the local index is considered stale
+
+CONFIRM_LOCK = threading.Lock()
+
+class Get(NamedTuple):
+    url: str
+    params: dict | None = None
+    headers: dict = HEADERS
+    immutable: bool = False # the resource never changes (e.g. a file at a tag), cache it forever
+    consumer: Callable[[bytes], bool] | None = None # fed the body of a 200 response chunk by chunk until it returns True
+
+class Trace:
+    # Timed spans in the Chrome trace event format (chrome://tracing, https://ui.perfetto.dev).
+    # Each thread, each running asyncio task and each step that `gather_steps` drives alongside
+    # others gets a lane of its own so that spans on a lane nest; lanes of finished tasks and
+    # steps are handed to new ones.
+    STEP_LANE: contextvars.ContextVar[int | None] = contextvars.ContextVar("STEP_LANE", default=None)
+
+    def __init__(self) -> None:
+        self.events, self.lanes, self.names, self.free_lanes, self.free_step_lanes = [], {}, {}, [], []
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+
+    def lane(self) -> int:
+        if (lane := self.STEP_LANE.get()) is not None:
+            return lane
+        try:
+            task = asyncio.current_task()
+        except RuntimeError: # no running event loop
+            task = None
+        key = task or threading.get_ident()
+        with self.lock:
+            if (lane := self.lanes.get(key)) is not None:
+                return lane
+            lane = self.lanes[key] = self.free_lanes.pop() if task and self.free_lanes else len(self.names) + 1
+            self.names.setdefault(lane, "asyncio tasks" if task else threading.current_thread().name)
+        if task:
+            task.add_done_callback(self.release_lane)
+        return lane
+
+    def release_lane(self, task: asyncio.Task) -> None:
+        with self.lock:
+            self.free_lanes.append(self.lanes.pop(task))
+
+    def step_lanes(self, count: int) -> list[int]:
+        lanes = []
+        with self.lock:
+            for _ in range(count):
+                lanes.append(lane := self.free_step_lanes.pop() if self.free_step_lanes else len(self.names) + 1)
+                self.names.setdefault(lane, "gathered steps")
+        return lanes
+
+    def release_step_lanes(self, lanes: list[int]) -> None:
+        with self.lock:
+            self.free_step_lanes.extend(lanes)
+
+    def add(self, category: str, name: str, start: float, end: float, lane: int, args: dict) -> None:
+        event = {"name": name, "cat": category, "ph": "X", "pid": 1, "tid": lane,
+                 "ts": round((start - self.origin) * 1e6, 1), "dur": round((end - start) * 1e6, 1), "args": args}
+        with self.lock:
+            self.events.append(event)
+
+    def export(self, path: pathlib.Path) -> None:
+        lanes = [{"name": "thread_name", "ph": "M", "pid": 1, "tid": lane, "args": {"name": name}}
+                 for lane, name in self.names.items()]
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({"traceEvents": lanes + self.events, "displayTimeUnit": "ms"}, file)
+
+    def summary(self) -> str:
+        stages = collections.defaultdict(list)
+        for event in self.events:
+            stages[event["cat"], event["name"]].append(event)
+        lines = [f"{'stage':<40} {'count':>6} {'total s':>8} {'mean ms':>8} {'max ms':>8} {'KiB':>9} {'cached':>7} {'errors':>6}"]
+        for (category, name), events in sorted(stages.items(), key=lambda item: -sum(event["dur"] for event in item[1])):
+            durations = [event["dur"] / 1000 for event in events]
+            size = sum(event["args"].get("bytes", 0) for event in events) / 1024
+            cached = sum(event["args"].get("cache") in ("hit", "revalidated") for event in events)
+            errors = sum("error" in event["args"] or (status := event["args"].get("status", 0)) >= 400 and status != 404
+                         for event in events) # a 404 is an answer, such as a missing project or file
+            lines.append(f"{f'{category}: {name}'[:40]:<40} {len(events):>6} {sum(durations) / 1000:>8.3f}"
+                         f" {sum(durations) / len(durations):>8.1f} {max(durations):>8.1f} {size:>9.1f} {cached:>7} {errors:>6}")
+        return "\n".join(lines)
+
+@contextlib.contextmanager
+def on_lane(lane: int | None):
+    # Spans opened in the block go to `lane` (None keeps the thread's or task's own). Set only
+    # while a step runs, as a generator shares its driver's context across yields.
+    token = Trace.STEP_LANE.set(lane)
+    try:
+        yield
+    finally:
+        Trace.STEP_LANE.reset(token)
+
+@contextlib.contextmanager
+def span(category: str, name: str, /, **args):
+    # Records the time spent in the block when tracing; the block may add to the yielded args.
+    if TRACE is None:
+        yield args
+        return
+    lane, start = TRACE.lane(), time.perf_counter()
+    try:
+        yield args
+    except GeneratorExit: # a step abandoned by its driver
+        raise
+    except BaseException as exception:
+        args["error"] = f"{type(exception).__name__}: {exception}"
+        raise
+    finally:
+        TRACE.add(category, name, start, time.perf_counter(), lane, args)
 
 class Regex:
-    PYPI_PACKAGE_NAME = re.compile(r"[a-zA-Z](?:[a-zA-Z0-9]+|(?:\-|\.[a-zA-Z0-9]+))*")
-    GITHUB_BRANCH = re.compile(r"<span class=\"Text-sc-17v1xeu-0 bOMzPg\">.*?>(?P<branch>.*?)</span>")
-    GITHUB_TAG = re.compile(r"<a.*?href=\".*?/releases/tag/.*?>(?P<tag>.*?)</a>")
-    GITHUB_VERSION_TAG = r"<a.*?href=\".*?/releases/tag/.*?>(?P<tag>.*?{version}.*?)</a>" 
-    DEPENDENCIES = re.compile(r"(?:(?:install_requires|requires)\s*?=\s*?\[(?P<deps>(\s*.*?)+)\])")
-    STRING = re.compile(r"[\"'](.*?)[\"']")
     DID_YOU_MEAN = re.compile(r"Did you mean '.*?>(?P<name>.*?)<.*?'\?")
+    SIMPLE_PROJECT = re.compile(r"<a href=\"[^\"]*\">(?P<name>[^<]*)</a>")
+    NAME_SEPARATORS = re.compile(r"[-_.]+")
+    CONTENT_RANGE = re.compile(r"bytes (?P<start>\d+)-(?P<end>\d+)/(?P<total>\d+)")
+    WHEEL_METADATA = re.compile(r"[^/]+\.dist-info/METADATA")
+    LINE_CONTINUATION = re.compile(r"\\\r?\n")
+    REQUIREMENT_OPTIONS = re.compile(r"\s--[a-z].*") # --hash=..., --config-settings=... after a requirement
+    EXTRA_MARKER = re.compile(r"\(?\s*extra\s*==\s*[\"'](?P<extra>[^\"']+)[\"']\s*\)?")
+
+class ZipRecord:
+    END_OF_CENTRAL_DIRECTORY = struct.Struct("<4s4H2LH")
+    ZIP64_LOCATOR = struct.Struct("<4sLQL")
+    ZIP64_END_OF_CENTRAL_DIRECTORY = struct.Struct("<4sQ2H2L4Q")
+    CENTRAL_DIRECTORY_ENTRY = struct.Struct("<4s6H3L5H2L")
+    LOCAL_FILE_HEADER = struct.Struct("<4s5H3L2H")
+
+class SdistScanner:
+    # Incrementally gunzips and walks a source distribution's tar stream, keeping only the
+    # top-level files that declare dependencies and stopping as soon as they settle the question.
+    WANTED = ("PKG-INFO", "pyproject.toml", "setup.cfg", "setup.py")
+    MAX_MEMBER_SIZE = 4 * 1024 * 1024
+    BLOCK = 512
+
+    def __init__(self) -> None:
+        self.decompressor = None
+        self.buffer = bytearray()
+        self.files = {}
+        self.pending = self.next_name = None
+        self.skip = 0
+        self.done = False
+
+    def feed(self, chunk: bytes) -> bool:
+        if not self.done:
+            if self.decompressor is None: # some servers already strip the gzip layer
+                self.decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16) if chunk[:2] == b"\x1f\x8b" else False
+            self.buffer += self.decompressor.decompress(chunk) if self.decompressor else chunk
+            self.process()
+        return self.done
+
+    def process(self) -> None:
+        while not self.done:
+            if self.skip:
+                dropped = min(self.skip, len(self.buffer))
+                del self.buffer[:dropped]
+                self.skip -= dropped
+                if self.skip:
+                    return
+            if self.pending is not None:
+                kind, name, size = self.pending
+                padded = -(-size // self.BLOCK) * self.BLOCK
+                if len(self.buffer) < padded:
+                    return
+                data = bytes(self.buffer[:size])
+                del self.buffer[:padded]
+                self.pending = None
+                self.member(kind, name, data)
+                continue
+            if len(self.buffer) < self.BLOCK:
+                return
+            header = bytes(self.buffer[:self.BLOCK])
+            del self.buffer[:self.BLOCK]
+            if not header.strip(b"\0"):
+                self.done = True # end of archive
+                return
+            kind, name, size = self.parse_header(header)
+            if kind in "xL" or (kind in "0\0" and self.wanted(name) and size <= self.MAX_MEMBER_SIZE):
+                self.pending = (kind, name, size)
+            else:
+                self.skip = -(-size // self.BLOCK) * self.BLOCK
+
+    def parse_header(self, header: bytes) -> tuple[str, str, int]:
+        kind = chr(header[156]) if header[156] else "\0"
+        name = header[:100].split(b"\0", 1)[0].decode("utf-8", errors="replace")
+        if header[257:262] == b"ustar" and header[345]:
+            prefix = header[345:500].split(b"\0", 1)[0].decode("utf-8", errors="replace")
+            name = f"{prefix}/{name}"
+        if kind not in "xLg":
+            name, self.next_name = self.next_name or name, None
+        field = header[124:136]
+        size = int.from_bytes(field[1:], "big") if field[0] & 0x80 else int(field.strip(b"\0 ") or b"0", 8)
+        return kind, name, size
+
+    def wanted(self, name: str) -> bool:
+        parts = name.strip("/").split("/")
+        return len(parts) == 2 and parts[1] in self.WANTED
+
+    def member(self, kind: str, name: str, data: bytes) -> None:
+        if kind == "L":
+            self.next_name = data.rstrip(b"\0").decode("utf-8", errors="replace")
+        elif kind == "x":
+            for record in data.decode("utf-8", errors="replace").splitlines():
+                key, _, value = record.partition(" ")[2].partition("=")
+                if key == "path":
+                    self.next_name = value
+        else:
+            self.files[name.rsplit("/", 1)[1]] = data
+            self.done = self.settled() or len(self.files) == len(self.WANTED)
+
+    def settled(self) -> bool:
+        if "PKG-INFO" in self.files and static_requires_dist(self.files["PKG-INFO"]):
+            return True
+        if "pyproject.toml" in self.files:
+            try:
+                project = tomllib.loads(self.files["pyproject.toml"].decode("utf-8")).get("project", {})
+            except (UnicodeDecodeError, tomllib.TOMLDecodeError):
+                return False
+            return "dependencies" in project and "dependencies" not in project.get("dynamic", ())
+        return False
+
+    def dependencies(self) -> tuple[set, set] | None:
+        if "PKG-INFO" in self.files and static_requires_dist(self.files["PKG-INFO"]):
+            return parse_core_metadata(self.files["PKG-INFO"])
+        for filename, parse in SETUP_FILES:
+            if filename in self.files:
+                try:
+                    dependencies, optional_dependencies = parse(self.files[filename].decode("utf-8"))
+                except (UnicodeDecodeError, ValueError, configparser.Error):
+                    continue
+                if dependencies or optional_dependencies:
+                    return dependencies, optional_dependencies
+        return None
 
 class PyPIPackageHTMLParser(HTMLParser):
+    WANTED = ("Name", "Version", "Summary", "License", "Author", "Requires")
+
     def __init__(self, *, convert_charrefs: bool = True) -> None:
         super().__init__(convert_charrefs=convert_charrefs)
         self.capture = None
         self.package = {}
+        self.links_done = self.done = False
+
+    def feed(self, data: str) -> None:
+        with span("parse", "PyPIPackageHTMLParser.feed", characters=len(data)):
+            super().feed(data)
+
+    def check_done(self):
+        if self.links_done and all(key in self.package for key in self.WANTED):
+            self.done = True
 
     def handle_starttag(self, tag, attrs):
         attrs = dict(attrs)
-        if tag == "h1":
+        if tag == "div" and "project-description" in (attrs.get("class") or ""):
+            self.done = True # everything wanted sits in the header and sidebar, the rest is the README
+        elif tag == "h1":
             if "class" in attrs and attrs["class"] == "package-header__name":
                 self.capture = attrs["class"]
         elif tag == "p":
@@ -62,6 +379,8 @@ class PyPIPackageHTMLParser(HTMLParser):
         if self.capture == "Project links":
             if tag == "ul":
                 self.capture = None
+                self.links_done = True
+                self.check_done()
             elif tag == "a":
                 url = self.package["Links"].pop(-1)
                 self.package["Links"].append((self.lastdata, url))
@@ -91,6 +410,7 @@ class PyPIPackageHTMLParser(HTMLParser):
             if not (self.capture == "Author:" and self.lasttag == "strong" and not self.lastdata) and \
                not (self.capture == "Project links"):
                 self.capture = None
+                self.check_done()
         else:
             if self.lastdata in ("Project links", "License:", "Author:", "Requires:"):
                 self.capture = self.lastdata
@@ -110,6 +430,10 @@ class SnykAdvisorHTMLParser(HTMLParser):
                       "Maintainers", "Wheels")
         self.progress = {title: False for title in self.spans}
         self.package_health = {}
+
+    def feed(self, data: str) -> None:
+        with span("parse", "SnykAdvisorHTMLParser.feed", characters=len(data)):
+            super().feed(data)
     
     def handle_starttag(self, tag, attrs):
         ...
@@ -131,26 +455,697 @@ class SnykAdvisorHTMLParser(HTMLParser):
                 self.capture = None
         self.lastdata = data
 
+class SimpleIndexHTMLParser(HTMLParser):
+    def __init__(self, base_url: str, *, convert_charrefs: bool = True) -> None:
+        super().__init__(convert_charrefs=convert_charrefs)
+        self.base_url = base_url
+        self.current = None
+        self.files = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            attrs = dict(attrs)
+            url, _, fragment = urljoin(self.base_url, attrs.get("href") or "").partition("#")
+            hash_name, _, hash_value = fragment.partition("=")
+            metadata = attrs.get("data-core-metadata", attrs.get("data-dist-info-metadata"))
+            metadata = dict([metadata.split("=", 1)]) if metadata and "=" in metadata else metadata == "true"
+            self.current = {
+                "filename": "", "url": url, "hashes": {hash_name: hash_value} if hash_value else {},
+                "requires-python": attrs.get("data-requires-python"),
+                "core-metadata": metadata,
+                "yanked": attrs["data-yanked"] or True if "data-yanked" in attrs else False,
+            }
+
+    def handle_endtag(self, tag):
+        if tag == "a" and self.current is not None:
+            self.files.append(self.current)
+            self.current = None
+
+    def handle_data(self, data):
+        if self.current is not None:
+            self.current["filename"] += data.strip()
+
+NAME_CHARACTERS = string.ascii_letters + string.digits + "._-"
+
 def is_valid_package_name(name: str) -> bool:
-    if re.match(r"[a-zA-Z](?:[a-zA-Z0-9]+|(?:\-|\.[a-zA-Z0-9]+))*", name):
-        return True
-    return False
+    # PEP 508: ASCII letters, digits, ".", "_" and "-", beginning and ending with a letter or
+    # digit. Stripping every allowed character leaves nothing only if there was nothing else.
+    return name.isascii() and name[:1].isalnum() and name[-1:].isalnum() and not name.strip(NAME_CHARACTERS)
+
+def canonical_name(name: str) -> str:
+    # PEP 503. Most names are already lowercase with single dashes and skip the substitution.
+    name = name.lower()
+    if "_" in name or "." in name or "--" in name:
+        return Regex.NAME_SEPARATORS.sub("-", name)
+    return name
+
+normalize_name = functools.lru_cache(maxsize=65536)(canonical_name)
+
+def normalize_many(names) -> list[str]:
+    # Bulk normalization for requirement files and whole index listings, where spellings
+    # repeat: each distinct one is computed once, without growing the shared cache.
+    canonical = {}
+    return [canonical[name] if name in canonical else canonical.setdefault(name, canonical_name(name)) for name in names]
+
+def trigrams(normalized: str) -> set[str]:
+    padded = f"^{normalized}$"
+    return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+def edit_distance(a: str, b: str) -> int:
+    # Optimal string alignment distance, a transposition counts as one edit.
+    previous, current = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous, current = previous, current, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+    return current[-1]
+
+def file_version(filename: str) -> str | None:
+    try:
+        if filename.endswith(".whl"):
+            return str(parse_wheel_filename(filename)[1])
+        return str(parse_sdist_filename(filename)[1])
+    except ValueError: # eggs, installers and other legacy or malformed file names
+        return None
+
+class SimpleIndexMirror:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE IF NOT EXISTS projects (id INTEGER PRIMARY KEY, normalized TEXT UNIQUE, name TEXT, serial INTEGER);
+        CREATE TABLE IF NOT EXISTS trigrams (trigram TEXT PRIMARY KEY, ids BLOB);
+        CREATE TABLE IF NOT EXISTS pages (normalized TEXT PRIMARY KEY, serial INTEGER, data BLOB);
+    """
+    # Postings are keyed by trigram and name length, so a lookup only reads names of similar length.
+    LENGTH_SLACK = 2
+
+    def __init__(self, path: pathlib.Path) -> None:
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(self.SCHEMA)
+        if "serial" not in (column[1] for column in self.connection.execute("PRAGMA table_info(projects)")):
+            self.connection.execute("ALTER TABLE projects ADD COLUMN serial INTEGER") # name index built by an older version
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def meta(self, key: str) -> str | None:
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    @property
+    def updated(self) -> float:
+        return float(self.meta("updated") or 0.0)
+
+    @property
+    def stale(self) -> bool:
+        return time.time() - self.updated > INDEX_MAX_AGE
+
+    def insert_projects(self, projects: list[tuple[str, str, int | None]], merge: bool = True) -> None:
+        # Must be called with the lock held, inside a transaction.
+        start = self.connection.execute("SELECT COALESCE(MAX(id) + 1, 0) FROM projects").fetchone()[0]
+        rows, postings = [], collections.defaultdict(lambda: array.array("I"))
+        for id_, (normalized, name, serial) in enumerate(projects, start):
+            rows.append((id_, normalized, name, serial))
+            for trigram in trigrams(normalized):
+                postings[f"{trigram}{len(normalized)}"].append(id_)
+        self.connection.executemany("INSERT INTO projects VALUES (?, ?, ?, ?)", rows)
+        for key, ids in postings.items():
+            if merge and (row := self.connection.execute("SELECT ids FROM trigrams WHERE trigram = ?", (key,)).fetchone()):
+                ids = array.array("I", row[0]) + ids
+            self.connection.execute("INSERT OR REPLACE INTO trigrams VALUES (?, ?)", (key, ids.tobytes()))
+
+    def remove_projects(self, names: set[str]) -> None:
+        # Must be called with the lock held, inside a transaction. Ids are handed out again by
+        # `insert_projects`, so they are taken out of the postings before their rows go.
+        postings = collections.defaultdict(set)
+        for name in names:
+            if (row := self.connection.execute("SELECT id FROM projects WHERE normalized = ?", (name,)).fetchone()):
+                for trigram in trigrams(name):
+                    postings[f"{trigram}{len(name)}"].add(row[0])
+        for key, ids in postings.items():
+            if (row := self.connection.execute("SELECT ids FROM trigrams WHERE trigram = ?", (key,)).fetchone()):
+                kept = array.array("I", (id_ for id_ in array.array("I", row[0]) if id_ not in ids))
+                if kept:
+                    self.connection.execute("UPDATE trigrams SET ids = ? WHERE trigram = ?", (kept.tobytes(), key))
+                else:
+                    self.connection.execute("DELETE FROM trigrams WHERE trigram = ?", (key,))
+        self.connection.executemany("DELETE FROM projects WHERE normalized = ?", ((name,) for name in names))
+        self.connection.executemany("DELETE FROM pages WHERE normalized = ?", ((name,) for name in names))
+
+    def replace_projects(self, projects: dict[str, int | None], serial: str | None = None) -> int:
+        normalized = {key: value for key, value in zip(normalize_many(projects), projects.items())}
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM projects")
+            self.connection.execute("DELETE FROM trigrams")
+            self.insert_projects([(key, *value) for key, value in normalized.items()], merge=False)
+            self.connection.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                                        (("updated", str(time.time())), ("serial", serial)))
+        return len(normalized)
+
+    def update_projects(self, projects: dict[str, int | None], serial: str | None = None) -> tuple[int, int, list[str]]:
+        with self.lock, self.connection:
+            known_serial = self.connection.execute("SELECT value FROM meta WHERE key = 'serial'").fetchone()
+            added = removed = 0
+            if serial is None or known_serial is None or known_serial[0] != serial:
+                known = dict(self.connection.execute("SELECT normalized, serial FROM projects"))
+                incoming = {key: value for key, value in zip(normalize_many(projects), projects.items())}
+                gone = known.keys() - incoming.keys()
+                self.remove_projects(gone)
+                self.insert_projects([(key, *value) for key, value in incoming.items() if key not in known])
+                self.connection.executemany(
+                    "UPDATE projects SET serial = ? WHERE normalized = ?",
+                    ((value[1], key) for key, value in incoming.items() if key in known and known[key] != value[1])
+                )
+                added, removed = len(incoming.keys() - known.keys()), len(gone)
+            self.connection.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                                        (("updated", str(time.time())), ("serial", serial)))
+            stale_pages = [name for (name,) in self.connection.execute(
+                "SELECT pages.normalized FROM pages JOIN projects USING (normalized) "
+                "WHERE projects.serial IS NULL OR pages.serial IS NULL OR pages.serial < projects.serial"
+            )]
+        return added, removed, stale_pages
+
+    def get(self, name: str) -> str | None:
+        with self.lock:
+            row = self.connection.execute("SELECT name FROM projects WHERE normalized = ?", (normalize_name(name),)).fetchone()
+        return row[0] if row else None
+
+    def closest(self, name: str, candidates: int = 64) -> str | None:
+        normalized = normalize_name(name)
+        keys = tuple(f"{trigram}{length}" for trigram in trigrams(normalized)
+                     for length in range(max(1, len(normalized) - self.LENGTH_SLACK), len(normalized) + self.LENGTH_SLACK + 1))
+        with self.lock:
+            rows = self.connection.execute(f"SELECT ids FROM trigrams WHERE trigram IN ({', '.join('?' * len(keys))})", keys).fetchall()
+            counts = collections.Counter()
+            for (ids,) in rows:
+                counts.update(array.array("I", ids))
+            ids = tuple(id_ for id_, _ in counts.most_common(candidates))
+            rows = self.connection.execute(f"SELECT normalized, name FROM projects WHERE id IN ({', '.join('?' * len(ids))})", ids).fetchall()
+        ranked = sorted(
+            (edit_distance(normalized, candidate), abs(len(candidate) - len(normalized)),
+             -difflib.SequenceMatcher(None, normalized, candidate).ratio(), candidate_name)
+            for candidate, candidate_name in rows
+        )
+        if ranked and ranked[0][0] <= max(1, len(normalized) // 4):
+            return ranked[0][-1]
+        return None
+
+    def page(self, name: str) -> dict | None:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT pages.data FROM pages JOIN projects USING (normalized) WHERE normalized = ? "
+                "AND projects.serial IS NOT NULL AND pages.serial >= projects.serial", (normalize_name(name),)
+            ).fetchone()
+        return json.loads(zlib.decompress(row[0])) if row else None
+
+    def store_page(self, name: str, serial: int | None, page: dict) -> None:
+        data = zlib.compress(json.dumps(page, separators=(",", ":")).encode())
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?)", (normalize_name(name), serial, data))
+
+INDEXES: dict[pathlib.Path, SimpleIndexMirror | None] = {}
+INDEXES_LOCK = threading.Lock()
+
+def open_index(path: pathlib.Path | None = None) -> SimpleIndexMirror | None:
+    path = path or INDEX_PATH
+    with INDEXES_LOCK:
+        if path not in INDEXES:
+            index = SimpleIndexMirror(path) if path.exists() else None
+            INDEXES[path] = index if index is not None and not index.stale else None
+        return INDEXES[path]
+
+def is_simple_json(response: requests.Response) -> bool:
+    return response.headers.get("Content-Type", "").startswith("application/vnd.pypi.simple.v1+json")
+
+def last_serial(response: requests.Response) -> int | None:
+    serial = response.headers.get("X-PyPI-Last-Serial", "")
+    return int(serial) if serial.isdigit() else None
+
+def simple_root_steps():
+    response = yield Get(f"{PYPI_URL}/simple/", headers=SIMPLE_HEADERS)
+    response.raise_for_status()
+    if is_simple_json(response):
+        projects = {project["name"]: project.get("_last-serial") for project in response.json()["projects"]}
+    else:
+        projects = dict.fromkeys(Regex.SIMPLE_PROJECT.findall(response.content.decode("utf-8")))
+    serial = last_serial(response)
+    return projects, None if serial is None else str(serial)
+
+def simple_project_steps(name: str, mirror: SimpleIndexMirror | None = None):
+    mirror = mirror or open_index()
+    if mirror is not None and (page := mirror.page(name)) is not None:
+        return page
+    response = yield Get(f"{PYPI_URL}/simple/{normalize_name(name)}/", headers=SIMPLE_HEADERS)
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    if is_simple_json(response):
+        page = response.json()
+    else:
+        html_parser = SimpleIndexHTMLParser(response.url)
+        html_parser.feed(response.content.decode("utf-8"))
+        page = {"name": name, "files": html_parser.files}
+    if "versions" not in page:
+        page["versions"] = sorted({version for file in page["files"] if (version := file_version(file["filename"]))})
+    if mirror is not None:
+        mirror.store_page(name, last_serial(response), page)
+    return page
 
 def confirm(message: str = "", question = "Are you sure?") -> bool:
-    answer = input(f"{question} {message + ' ' if message else message}(y/n): ")
+    with CONFIRM_LOCK: # prompts from concurrent lookups must not interleave
+        answer = input(f"{question} {message + ' ' if message else message}(y/n): ")
     if answer.strip() in ("y", "Y"):
         return True
     return False
 
-def did_you_mean(session: requests.Session, query: str) -> str:
-    response = session.get(url="https://pypi.org/search/", params={"q": query}, headers=HEADERS)
-    content = response.content.decode("utf-8")
-    if (match_ := re.search(Regex.DID_YOU_MEAN, content)):
-        if confirm(question=f"Did you mean {repr(match_["name"])}?"):
-            return match_["name"]
-    return query
+def did_you_mean_steps(query: str):
+    with span("lookup", "did-you-mean", query=query):
+        if (index := open_index()) is not None:
+            if index.get(query) is None and (name := index.closest(query)):
+                if confirm(question=f"Did you mean {repr(name)}?"):
+                    return name
+            return query
 
-def search_dependencies(session: requests.Session, package: dict[str, str], version: str):
+        response = yield Get(f"{PYPI_URL}/search/", params={"q": query})
+        if response.status_code != 200:
+            return query # a suggestion is not worth failing the lookup for
+        content = response.content.decode("utf-8")
+        if (match_ := re.search(Regex.DID_YOU_MEAN, content)):
+            if confirm(question=f"Did you mean {repr(match_["name"])}?"):
+                return match_["name"]
+        return query
+
+def setup_cfg_dependencies(content: str) -> tuple[set, set]:
+    dependencies = set()
+    config = configparser.ConfigParser(interpolation=None)
+    config.read_string(content)
+    for section in config.sections():
+        # One requirement per line: "requests >= 2.0" must not become three requirements.
+        if "requires-dist" in config[section]:
+            dependencies.update(requirement_lines(config[section]["requires-dist"]))
+        elif "install_requires" in config[section]:
+            dependencies.update(requirement_lines(config[section]["install_requires"]))
+    return dependencies, set()
+
+def pyproject_dependencies(content: str) -> tuple[set, set]:
+    dependencies, optional_dependencies = set(), set()
+    toml_config = tomllib.loads(content)
+    if "project" in toml_config:
+        if "dependencies" in toml_config["project"]:
+            dependencies.update(toml_config["project"]["dependencies"])
+        if "optional-dependencies" in toml_config["project"]:
+            for option in toml_config["project"]["optional-dependencies"]:
+                deps = toml_config["project"]["optional-dependencies"][option]
+                optional_dependencies.add((option, tuple(deps)))
+    return dependencies, optional_dependencies
+
+def static_value(node: ast.AST, constants: dict):
+    # The value of a literal made of strings, lists, tuples and dicts, possibly naming
+    # module-level constants or adding lists together; anything computed raises ValueError.
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if isinstance(node, ast.Name) and node.id in constants:
+        return constants[node.id]
+    if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+        items = []
+        for element in node.elts:
+            if isinstance(element, ast.Starred):
+                items.extend(static_value(element.value, constants))
+            else:
+                items.append(static_value(element, constants))
+        return items
+    if isinstance(node, ast.Dict):
+        return {static_value(key, constants): static_value(value, constants) for key, value in zip(node.keys, node.values)
+                if key is not None}
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == "dict" and not node.args:
+        return {keyword.arg: static_value(keyword.value, constants) for keyword in node.keywords if keyword.arg}
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+        left, right = static_value(node.left, constants), static_value(node.right, constants)
+        if type(left) is type(right) and isinstance(left, (list, str)):
+            return left + right
+    raise ValueError(f"not a static value: {ast.dump(node)[:80]}")
+
+def requirement_lines(value) -> list[str]:
+    # setuptools also takes requirements as one string, one per line.
+    lines = value.splitlines() if isinstance(value, str) else value
+    if not isinstance(lines, list) or not all(isinstance(line, str) for line in lines):
+        raise ValueError("requirements must be strings")
+    return [line for line in (line.split(" #", 1)[0].strip() for line in lines) if line and not line.startswith("#")]
+
+def setup_py_tokens_dependencies(content: str) -> set:
+    # For files that no longer parse (Python 2): the strings of `install_requires = [...]`.
+    dependencies, state, depth = set(), None, 0
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(content).readline):
+            if token.type == tokenize.NAME and token.string == "install_requires" or \
+               token.type == tokenize.STRING and token.string.strip("\"'") == "install_requires":
+                state = "name"
+            elif state == "name":
+                state = "assigned" if token.type == tokenize.OP and token.string in ("=", ":") else None
+            elif state == "assigned":
+                state, depth = ("list", 1) if token.type == tokenize.OP and token.string in ("[", "(") else (None, 0)
+            elif state == "list":
+                if token.type == tokenize.OP and token.string in ("[", "("):
+                    depth += 1
+                elif token.type == tokenize.OP and token.string in ("]", ")"):
+                    depth -= 1
+                    state = "list" if depth else None
+                elif token.type == tokenize.STRING:
+                    try:
+                        dependencies.update(requirement_lines(ast.literal_eval(token.string)))
+                    except (ValueError, SyntaxError):
+                        continue
+    except (tokenize.TokenError, SyntaxError):
+        pass
+    return dependencies
+
+def setup_py_dependencies(content: str) -> tuple[set, set]:
+    # The file is parsed, never run: only literal `setup(install_requires=..., extras_require=...)`
+    # arguments and the module-level constants they name are understood.
+    try:
+        module = ast.parse(content)
+    except (SyntaxError, ValueError, RecursionError, MemoryError):
+        return setup_py_tokens_dependencies(content), set()
+
+    constants = {}
+    for statement in module.body:
+        try:
+            if isinstance(statement, ast.Assign) and len(statement.targets) == 1 and isinstance(statement.targets[0], ast.Name):
+                constants[statement.targets[0].id] = static_value(statement.value, constants)
+            elif isinstance(statement, ast.AnnAssign) and isinstance(statement.target, ast.Name) and statement.value:
+                constants[statement.target.id] = static_value(statement.value, constants)
+            elif isinstance(statement, ast.AugAssign) and isinstance(statement.target, ast.Name) and \
+                 isinstance(statement.op, ast.Add) and statement.target.id in constants:
+                constants[statement.target.id] = constants[statement.target.id] + static_value(statement.value, constants)
+        except (ValueError, TypeError, RecursionError):
+            if isinstance(statement, (ast.Assign, ast.AnnAssign, ast.AugAssign)):
+                for target in getattr(statement, "targets", [getattr(statement, "target", None)]):
+                    constants.pop(getattr(target, "id", None), None) # no longer static
+
+    arguments = {}
+    for node in ast.walk(module):
+        if isinstance(node, ast.Call) and (getattr(node.func, "id", None) == "setup" or getattr(node.func, "attr", None) == "setup"):
+            for keyword in node.keywords:
+                try:
+                    if keyword.arg is None: # setup(**kwargs)
+                        value = static_value(keyword.value, constants)
+                        arguments.update(value if isinstance(value, dict) else {})
+                    else:
+                        arguments[keyword.arg] = static_value(keyword.value, constants)
+                except (ValueError, TypeError, RecursionError):
+                    continue
+
+    dependencies, optional = set(), collections.defaultdict(list)
+    try:
+        dependencies.update(requirement_lines(arguments.get("install_requires", arguments.get("requires", []))))
+    except ValueError:
+        pass
+    extras = arguments.get("extras_require", {})
+    for key, value in (extras.items() if isinstance(extras, dict) else ()):
+        try:
+            lines = requirement_lines(value)
+        except ValueError:
+            continue
+        extra, _, marker = str(key).partition(":") # "extra:marker" and ":marker" keys (setuptools)
+        if marker:
+            lines = [f"{requirement.strip()}; ({own_marker.strip()}) and ({marker})" if own_marker else f"{line}; {marker}"
+                     for line in lines for requirement, _, own_marker in [line.partition(";")]]
+        if extra:
+            optional[extra].extend(lines)
+        else:
+            dependencies.update(lines)
+    return dependencies, {(extra, tuple(lines)) for extra, lines in optional.items()}
+
+# Files a source tree may declare its dependencies in, in order of precedence: setuptools lets
+# the [project] table of pyproject.toml override setup.cfg, and SdistScanner settles on it.
+SETUP_FILES = (("pyproject.toml", pyproject_dependencies), ("setup.cfg", setup_cfg_dependencies), ("setup.py", setup_py_dependencies))
+
+def split_requires_dist(requires_dist: list[str]) -> tuple[set, set]:
+    dependencies, optional = set(), collections.defaultdict(list)
+    for line in requires_dist:
+        requirement, _, marker = (part.strip() for part in line.partition(";"))
+        extras = Regex.EXTRA_MARKER.findall(marker)
+        if not extras:
+            dependencies.add(line.strip())
+            continue
+        if " or " not in marker: # keep the environment part of the marker, drop the extra clause
+            marker = " and ".join(clause for clause in marker.split(" and ") if not Regex.EXTRA_MARKER.fullmatch(clause.strip()))
+        for extra in extras:
+            optional[extra].append(f"{requirement}; {marker}" if marker else requirement)
+    return dependencies, {(extra, tuple(requirements)) for extra, requirements in optional.items()}
+
+def static_requires_dist(content: bytes) -> bool:
+    # Whether a PKG-INFO reliably lists the requirements: it names some, or is Metadata 2.2+
+    # (PEP 643) and does not mark them as dynamic.
+    metadata = email.parser.BytesHeaderParser().parsebytes(content)
+    if metadata.get_all("Requires-Dist"):
+        return True
+    try:
+        version = tuple(int(part) for part in metadata.get("Metadata-Version", "1.0").split("."))
+    except ValueError:
+        return False
+    return version >= (2, 2) and "requires-dist" not in (field.lower() for field in metadata.get_all("Dynamic") or ())
+
+def parse_core_metadata(content: bytes) -> tuple[set, set]:
+    metadata = email.parser.BytesHeaderParser().parsebytes(content)
+    return split_requires_dist(metadata.get_all("Requires-Dist") or [])
+
+def release_files(page: dict, version: str) -> list[dict]:
+    version = canonicalize_version(version)
+    return [file for file in page["files"]
+            if (file_version_ := file_version(file["filename"])) and canonicalize_version(file_version_) == version]
+
+def pure_wheels_first(files: list[dict]) -> list[dict]:
+    # Pure wheels carry no platform quirks in their metadata.
+    return sorted((file for file in files if file["filename"].endswith(".whl")),
+                  key=lambda file: "-none-any.whl" not in file["filename"])
+
+def metadata_dependencies_steps(files: list[dict]):
+    # PEP 658/714: the index serves each wheel's METADATA next to it as `<wheel url>.metadata`.
+    for wheel in pure_wheels_first(files):
+        if not wheel.get("core-metadata"):
+            continue
+        response = yield Get(f"{wheel['url']}.metadata", immutable=True)
+        if response.status_code != 200:
+            continue
+        expected = wheel["core-metadata"].get("sha256") if isinstance(wheel["core-metadata"], dict) else None
+        if expected and hashlib.sha256(response.content).hexdigest() != expected:
+            continue
+        return parse_core_metadata(response.content)
+    return None
+
+def abort_download(chunk: bytes) -> bool:
+    return True
+
+def range_request(url: str, byte_range: str) -> Get:
+    # A server that ignores Range answers 200 with the whole file: `abort_download` drops it after one chunk.
+    return Get(url, headers={**FILE_HEADERS, "Range": f"bytes={byte_range}"}, immutable=True, consumer=abort_download)
+
+def wheel_metadata_steps(url: str, tail_size: int = 64 * 1024):
+    # Reads `*.dist-info/METADATA` out of a remote wheel with HTTP range requests: the tail of the
+    # file holds the central directory and, as dist-info is written last, usually METADATA itself.
+    response = yield range_request(url, f"-{tail_size}")
+    match_ = Regex.CONTENT_RANGE.fullmatch(response.headers.get("Content-Range", ""))
+    if response.status_code != 206 or not match_:
+        raise ValueError(f"{url} does not support range requests")
+    total, segments = int(match_["total"]), [(int(match_["start"]), response.content)]
+
+    def read_steps(start: int, length: int):
+        length = min(length, total - start)
+        for segment_start, data in segments:
+            if segment_start <= start and start + length <= segment_start + len(data):
+                return data[start - segment_start:start - segment_start + length]
+        response = yield range_request(url, f"{start}-{start + length - 1}")
+        if response.status_code != 206 or len(response.content) < length:
+            raise ValueError(f"unexpected response to a range request for {url}")
+        segments.append((start, response.content))
+        return response.content[:length]
+
+    tail = segments[0][1]
+    end = tail.rfind(b"PK\x05\x06")
+    if end < 0:
+        raise ValueError(f"{url} is not a zip file")
+    _, _, _, _, entries, directory_size, directory_offset, _ = ZipRecord.END_OF_CENTRAL_DIRECTORY.unpack_from(tail, end)
+    if 0xFFFFFFFF in (directory_size, directory_offset) or entries == 0xFFFF:
+        _, _, record_offset, _ = ZipRecord.ZIP64_LOCATOR.unpack_from(tail, end - ZipRecord.ZIP64_LOCATOR.size)
+        record = yield from read_steps(record_offset, ZipRecord.ZIP64_END_OF_CENTRAL_DIRECTORY.size)
+        *_, directory_size, directory_offset = ZipRecord.ZIP64_END_OF_CENTRAL_DIRECTORY.unpack(record)
+
+    directory = yield from read_steps(directory_offset, directory_size)
+    position = 0
+    while position + ZipRecord.CENTRAL_DIRECTORY_ENTRY.size <= len(directory):
+        (signature, _, _, _, method, _, _, _, compressed_size, size, name_length, extra_length, comment_length,
+         _, _, _, offset) = ZipRecord.CENTRAL_DIRECTORY_ENTRY.unpack_from(directory, position)
+        if signature != b"PK\x01\x02":
+            raise ValueError(f"corrupt central directory in {url}")
+        position += ZipRecord.CENTRAL_DIRECTORY_ENTRY.size
+        name = directory[position:position + name_length].decode("utf-8")
+        extra = directory[position + name_length:position + name_length + extra_length]
+        position += name_length + extra_length + comment_length
+        if Regex.WHEEL_METADATA.fullmatch(name):
+            break
+    else:
+        return None
+
+    while len(extra) >= 4: # zip64 extended information replaces the fields saturated at 0xFFFFFFFF
+        header_id, data_size = struct.unpack_from("<2H", extra)
+        if header_id == 0x0001:
+            values = iter(struct.unpack_from(f"<{data_size // 8}Q", extra, 4))
+            size = next(values) if size == 0xFFFFFFFF else size
+            compressed_size = next(values) if compressed_size == 0xFFFFFFFF else compressed_size
+            offset = next(values) if offset == 0xFFFFFFFF else offset
+        extra = extra[4 + data_size:]
+
+    # Fetch the local header and the data in one go, assuming the local extra field matches the central one.
+    yield from read_steps(offset, ZipRecord.LOCAL_FILE_HEADER.size + name_length + extra_length + compressed_size)
+    header = yield from read_steps(offset, ZipRecord.LOCAL_FILE_HEADER.size)
+    *_, local_name_length, local_extra_length = ZipRecord.LOCAL_FILE_HEADER.unpack(header)
+    data = yield from read_steps(offset + ZipRecord.LOCAL_FILE_HEADER.size + local_name_length + local_extra_length,
+                                 compressed_size)
+    if method == 8:
+        return zlib.decompress(data, -15)
+    if method == 0:
+        return data
+    raise ValueError(f"unsupported compression method {method} in {url}")
+
+def wheel_dependencies_steps(files: list[dict]):
+    for wheel in pure_wheels_first(files)[:1]:
+        metadata = yield from wheel_metadata_steps(wheel["url"])
+        if metadata is not None:
+            return parse_core_metadata(metadata)
+    return None
+
+def sdist_dependencies_steps(files: list[dict]):
+    for sdist in [file for file in files if file["filename"].endswith(".tar.gz")][:1]:
+        scanner = SdistScanner()
+        response = yield Get(sdist["url"], headers=FILE_HEADERS, immutable=True, consumer=scanner.feed)
+        if response.status_code == 200:
+            return scanner.dependencies()
+    return None
+
+def search_dependencies_steps(package: dict[str, str], version: str, page: dict | None = None):
+    release = version or package.get("Version")
+    if page is None:
+        try:
+            page = yield from simple_project_steps(package["Name"])
+        except (requests.RequestException, ValueError, KeyError):
+            page = None
+    files = release_files(page, release) if page is not None and release else []
+    for stage in (metadata_dependencies_steps, wheel_dependencies_steps, sdist_dependencies_steps):
+        try:
+            result = yield from stage(files)
+        except (requests.RequestException, ValueError, KeyError, struct.error, zlib.error):
+            result = None # the index is unreachable or served something unexpected, try the next stage
+        if result is not None:
+            return result
+    return (yield from source_dependencies_steps(package, version))
+
+class GitRefs(NamedTuple):
+    head: str | None
+    branch: str | None
+    tags: dict[str, str] # tag name -> commit, annotated tags already peeled
+
+def parse_ref_advertisement(content: bytes) -> GitRefs:
+    head = branch = None
+    tags = {}
+    position = 0
+    while position + 4 <= len(content):
+        length = int(content[position:position + 4], 16)
+        if length < 4: # flush and delimiter packets
+            position += 4
+            continue
+        line = content[position + 4:position + length].rstrip(b"\n")
+        position += length
+        if line.startswith(b"#"):
+            continue
+        ref_line, _, capabilities = line.partition(b"\0")
+        commit, _, ref = ref_line.decode("utf-8").partition(" ")
+        for capability in capabilities.decode("utf-8").split():
+            if capability.startswith("symref=HEAD:refs/heads/"):
+                branch = capability.removeprefix("symref=HEAD:refs/heads/")
+        if ref == "HEAD":
+            head = commit
+        elif ref.startswith("refs/tags/"):
+            tag = ref.removeprefix("refs/tags/")
+            if tag.endswith("^{}"):
+                tags[tag.removesuffix("^{}")] = commit
+            else:
+                tags.setdefault(tag, commit)
+    return GitRefs(head, branch, tags)
+
+def git_refs_steps(repository_url: str):
+    # One smart-HTTP ref advertisement lists HEAD and every tag of the repository.
+    response = yield Get(f"{repository_url}.git/info/refs", params={"service": "git-upload-pack"}, headers=GIT_HEADERS)
+    if response.status_code in (401, 403, 404): # GitHub answers 401 for repositories that do not exist
+        return None
+    response.raise_for_status()
+    try:
+        return parse_ref_advertisement(response.content)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+JSON_LINES_LOCK = threading.Lock()
+
+def read_json_lines(path: pathlib.Path | None):
+    if path is None:
+        return
+    try:
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue # a line cut short by an interrupted run
+    except OSError:
+        pass
+
+def append_json_lines(path: pathlib.Path | None, entries: list[dict]) -> None:
+    if path is None or not entries:
+        return
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with JSON_LINES_LOCK, open(path, "a", encoding="utf-8") as file:
+            file.writelines(json.dumps(entry) + "\n" for entry in entries)
+    except OSError:
+        pass # like the HTTP cache, best effort
+
+class TagIndex:
+    # Append-only `{"tag": ..., "commit": ...}` lines per repository; later lines win.
+    def __init__(self, path: pathlib.Path | None) -> None:
+        self.path = path
+        self.tags = {}
+        for entry in read_json_lines(path):
+            if isinstance(entry, dict) and "tag" in entry and "commit" in entry:
+                self.tags[entry["tag"]] = entry["commit"]
+
+    def update(self, tags: dict[str, str]) -> int:
+        new = {tag: commit for tag, commit in tags.items() if self.tags.get(tag) != commit}
+        self.tags.update(new)
+        append_json_lines(self.path, [{"tag": tag, "commit": commit} for tag, commit in new.items()])
+        return len(new)
+
+def open_tag_index(host: str, repository_path: str) -> TagIndex:
+    if TAG_INDEX_DIR is None:
+        return TagIndex(None)
+    return TagIndex(TAG_INDEX_DIR / host / f"{repository_path.strip('/').lower().removesuffix('.git')}.jsonl")
+
+def find_tag(tags: dict[str, str], version: str, name: str | None = None) -> str | None:
+    candidates = [f"v{version}", version, f"release-{version}", f"version-{version}", f"release/{version}"]
+    if name:
+        candidates += [f"{prefix}{separator}{version}" for prefix in {name, normalize_name(name)}
+                       for separator in ("-", "-v", "_", "/", "/v", "@")]
+    for candidate in candidates:
+        if candidate in tags:
+            return candidate
+    pattern = re.compile(rf"(?:^|[^\d.]){re.escape(version)}$")
+    matches = [tag for tag in tags if pattern.search(tag)]
+    return min(matches, key=len) if matches else None
+
+def source_dependencies_steps(package: dict[str, str], version: str):
     source = source_url = None
     if "Links" in package:
         for _, url in package["Links"]:
@@ -162,115 +1157,1357 @@ def search_dependencies(session: requests.Session, package: dict[str, str], vers
                 break
 
     if source:
-        branch = tag = None
-        if not version:
-            response = session.get(source_url, headers=HEADERS)
-            content = response.content.decode("utf-8")
-            branch = re.search(Regex.GITHUB_BRANCH, content)["branch"]
-        else:
-            response = session.get(f"{source_url}/tags", headers=HEADERS)
-            content = response.content.decode("utf-8")
-            compiled_pattern = re.compile(Regex.GITHUB_VERSION_TAG.format(version=version))
-            if tag := re.search(compiled_pattern, content):
-                tag = tag["tag"]
-            else:
-                last_tag = None
-                while not tag or not last_tag:
-                    last_tag = re.findall(Regex.GITHUB_TAG, content)[-1]
-                    response = session.get(f"{source_url}/tags", params={"after": last_tag}, headers=HEADERS)
-                    content = response.content.decode("utf-8")
-                    tag = re.search(compiled_pattern, content)
-                if tag:
-                    tag = tag["tag"]
-
-        source_raw_url = f"https://raw.githubusercontent.com{source.path}/{tag if tag else branch}"
-        dependencies, optional_dependencies = set(), set()
-
-        response = session.get(f"{source_raw_url}/setup.cfg", headers=HEADERS)
-        if response.status_code != 404:
-            content = response.content.decode("utf-8")
-            config = configparser.ConfigParser()
-            config.read_string(content)
-            for section in config.sections():
-                if "requires-dist" in config[section]:
-                    dependencies.update(config[section]["requires-dist"].split())
-                elif "install_requires" in config[section]:
-                    dependencies.update(config[section]["install_requires"].split())
-        
-        if not dependencies:
-            response = session.get(f"{source_raw_url}/pyproject.toml", headers=HEADERS)
-            if response.status_code != 404:
-                content = response.content.decode("utf-8")
-                toml_config = tomllib.loads(content)
-                if "project" in toml_config:
-                    if "dependencies" in toml_config["project"]:
-                        dependencies.update(toml_config["project"]["dependencies"])
-                    if "optional-dependencies" in toml_config["project"]:
-                        for option in toml_config["project"]["optional-dependencies"]:
-                            deps = toml_config["project"]["optional-dependencies"][option]
-                            optional_dependencies.add((option, tuple(deps)))
-        
-        if not dependencies:
-            response = session.get(f"{source_raw_url}/setup.py", headers=HEADERS)
-            if response.status_code != 404:
-                content = response.content.decode("utf-8")
-                if (possible_deps := re.search(Regex.DEPENDENCIES, content)):
-                    dependencies.update(re.findall(Regex.STRING, possible_deps.group()))
+        with span("lookup", "tag resolution", repository=source_url, version=version, source="index") as details:
+            tag_index = open_tag_index(source.netloc, source.path)
+            commit = tag_index.tags.get(find_tag(tag_index.tags, version, package.get("Name"))) if version else None
+            if commit is None: # the default branch moves, and unknown versions may have been tagged since
+                details["source"] = "refs"
+                refs = yield from git_refs_steps(source_url.removesuffix(".git"))
+                if refs is None:
+                    return None, None
+                tag_index.update(refs.tags)
+                commit = tag_index.tags.get(find_tag(tag_index.tags, version, package.get("Name"))) if version else refs.head
+            details["commit"] = commit
+        if commit is None:
+            return None, None
+
+        # Files at a commit never change, so they (and their absence) are cached for good.
+        # All candidates are probed at once, their precedence is applied afterwards.
+        source_raw_url = f"https://raw.githubusercontent.com{source.path.removesuffix('.git')}/{commit}"
+        with span("lookup", "raw file probes", url=source_raw_url) as details:
+            responses = yield [Get(f"{source_raw_url}/{filename}", immutable=True) for filename, _ in SETUP_FILES]
+            dependencies, optional_dependencies = set(), set()
+            for (filename, parse), response in zip(SETUP_FILES, responses):
+                if dependencies:
+                    break
+                if isinstance(response, requests.RequestException):
+                    raise response
+                if response.status_code != 404:
+                    response.raise_for_status()
+                    try:
+                        with span("parse", filename, characters=len(response.content)):
+                            found, optional = parse(response.content.decode("utf-8"))
+                    except (UnicodeDecodeError, ValueError, configparser.Error):
+                        continue # an unreadable file, try the next candidate
+                    details["file"] = filename
+                    dependencies.update(found)
+                    optional_dependencies.update(optional)
 
         return dependencies, optional_dependencies
     return None, None
 
-def search(args) -> None:
-    query: str = args.query
-    version: str = args.version
+def json_license(info: dict) -> str | None:
+    if info.get("license_expression"):
+        return info["license_expression"]
+    if (license_ := next(iter((info.get("license") or "").strip().splitlines()), None)):
+        return license_
+    for classifier in info.get("classifiers") or ():
+        if classifier.startswith("License :: "):
+            return classifier.rsplit(" :: ", 1)[-1]
+    return None
 
-    session = requests.Session()
+def package_from_json(data: dict) -> dict:
+    info = data["info"]
+    package = {"Name": info["name"], "Version": info["version"]}
+    if info.get("summary"):
+        package["Summary"] = info["summary"]
+    if (license_ := json_license(info)):
+        package["License"] = license_
+    author = info.get("author")
+    if info.get("author_email"):
+        addresses = email.utils.getaddresses([info["author_email"]])
+        package["Author-email"] = ", ".join(f"mailto:{address}" for _, address in addresses if address)
+        if not author:
+            author = ", ".join(name for name, _ in addresses if name)
+    if author:
+        package["Author"] = author
+    if info.get("requires_python"):
+        package["Requires"] = f"Python {info['requires_python']}"
+    links = list((info.get("project_urls") or {}).items())
+    if info.get("home_page") and info["home_page"] not in (url for _, url in links):
+        links.insert(0, ("Homepage", info["home_page"]))
+    if links:
+        package["Links"] = links
+    return package
 
-    query = did_you_mean(session, query)
-    
-    response = session.get(url=f"https://pypi.org/project/{query}/{f'{version}/' if version else ''}", headers=HEADERS)
-    content = response.content.decode("utf-8")
+def fetch_package_json_steps(name: str, version: str):
+    response = yield Get(f"{PYPI_URL}/pypi/{name}/{f'{version}/' if version else ''}json", headers=JSON_HEADERS)
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return package_from_json(response.json())
 
-    if content.find("We looked everywhere but couldn't find this page") != -1:
-        print(f"No such project named {repr(query)}{f' with version {repr(version)}' if version else ''} was found.")
-    else:
-        html_parser = PyPIPackageHTMLParser()
+def fetch_package_html_steps(name: str, version: str):
+    html_parser = PyPIPackageHTMLParser()
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    def consume(chunk: bytes) -> bool:
+        if not html_parser.done:
+            html_parser.feed(decoder.decode(chunk))
+        return html_parser.done
+
+    response = yield Get(f"{PYPI_URL}/project/{name}/{f'{version}/' if version else ''}", consumer=consume)
+    if response.status_code == 404:
+        return None
+    if response.status_code != 200:
+        content = response.content.decode("utf-8", errors="replace")
+        if content.find("We looked everywhere but couldn't find this page") != -1:
+            return None
+        response.raise_for_status() # an error page is not a project page
         html_parser.feed(content)
-        dependencies, optional_dependencies = search_dependencies(session, html_parser.package, version)
+    return html_parser.package
+
+def fetch_package_steps(name: str, version: str, backend: str = "json"):
+    with span("lookup", "project page", name=name, backend=backend) as details:
+        if backend == "json":
+            try:
+                package = yield from fetch_package_json_steps(name, version)
+                if package is not None:
+                    return package
+            except (ValueError, KeyError):
+                pass # throttling and server errors are left to propagate, the project page is on the same host
+            details["backend"] = "html" # the JSON API is missing or malformed, fall back to the project page
+        return (yield from fetch_package_html_steps(name, version))
+
+def format_package(package: dict, dependencies: set | None, optional_dependencies: set | None) -> str:
+    string = "\n".join(
+        (f"{key}: {value}" for key, value in package.items() if key != "Links")
+    )
+    if "Links" in package:
+        string += f"\nLinks:\n{' '*2}" + f"\n{' '*2}".join((f"{key}: {value}" for key, value in package["Links"]))
+    if dependencies:
+        string += f"\nDependencies: {dependencies}"
+    if optional_dependencies:
+        string += f"\nOptional Dependencies:"
+        for identifier, packages in optional_dependencies:
+            string += f"\n{' '*4}{repr(identifier):<10} --> {repr(packages)}"
+    return string
+
+class PooledSession(requests.Session):
+    # Adds the request and connection counts of its pools to CONNECTION_STATS when closed.
+    def close(self) -> None:
+        for adapter in {id(adapter): adapter for adapter in self.adapters.values()}.values():
+            for manager in (adapter.poolmanager, *adapter.proxy_manager.values()):
+                for key in manager.pools.keys():
+                    if (pool := manager.pools.get(key)) is not None:
+                        with STATS_LOCK:
+                            CONNECTION_STATS[pool.host][0] += pool.num_requests
+                            CONNECTION_STATS[pool.host][1] += pool.num_connections
+        super().close()
+
+class NotRecorded(requests.RequestException):
+    # Not a ConnectionError: it is neither retried nor held against the host by the scheduler.
+    pass
+
+class FixtureArchive:
+    # Responses in a JSON lines file, bodies in base64, keyed by method, URL, Accept and Range
+    # like the HTTP cache. Recording keeps the first response to each request that is not
+    # retried; replaying serves it again, after the latency set for its host ("*" for the
+    # others), and fails for requests that were never recorded.
+    def __init__(self, path: pathlib.Path, replaying: bool, latency: dict[str, float] | None = None) -> None:
+        self.path, self.replaying, self.latency = path, replaying, latency or {}
+        self.entries, self.lock = {}, threading.Lock()
+        for entry in read_json_lines(path):
+            if isinstance(entry, dict) and "key" in entry:
+                self.entries.setdefault(entry["key"], entry)
+        if replaying and not self.entries:
+            raise ValueError(f"no recorded responses in {path}")
+
+    @staticmethod
+    def key(request: requests.PreparedRequest) -> str:
+        return f"{request.method} {request.url}\n{request.headers.get('Accept', '')}\n{request.headers.get('Range', '')}"
+
+    def record(self, request: requests.PreparedRequest, response: requests.Response, content: bytes) -> None:
+        key = self.key(request)
+        with self.lock:
+            if key in self.entries or response.status_code in RETRY_STATUSES: # the retried answer is kept instead
+                return
+            headers = {key: value for key, value in response.headers.items() if key not in HTTPCache.TRANSFER_HEADERS}
+            entry = self.entries[key] = {"key": key, "url": response.url, "status": response.status_code, "reason": response.reason,
+                                         "headers": headers, "body": base64.b64encode(content).decode("ascii")}
+        append_json_lines(self.path, [entry])
+
+    def replay(self, request: requests.PreparedRequest) -> requests.Response:
+        if (entry := self.entries.get(self.key(request))) is None:
+            raise NotRecorded(f"{request.url} was not recorded in {self.path}", request=request)
+        host = urlparse(request.url).netloc
+        if (latency := self.latency.get(host, self.latency.get("*", 0.0))):
+            time.sleep(latency)
+        response = build_response(entry["url"], entry["status"], entry["reason"], entry["headers"], base64.b64decode(entry["body"]))
+        response.request, response._content_consumed = request, True # streamed from the recorded body
+        return response
+
+class ArchiveAdapter(requests.adapters.HTTPAdapter):
+    # A transport that records what it fetches into an archive, or answers from it offline.
+    def __init__(self, archive: FixtureArchive, **kwargs) -> None:
+        self.archive = archive
+        super().__init__(**kwargs)
+
+    def send(self, request: requests.PreparedRequest, stream: bool = False, **kwargs) -> requests.Response:
+        if self.archive.replaying:
+            return self.archive.replay(request)
+        response = super().send(request, stream=stream, **kwargs)
+        if not stream:
+            self.archive.record(request, response, response.content)
+            return response
+        # A streamed body is recorded as far as the caller reads it, so that recording moves the
+        # same bytes as a live run: a parser or scanner that stops early leaves the rest unread.
+        iter_content, chunks = response.iter_content, []
+
+        def tee(*args, **kwargs):
+            try:
+                for chunk in iter_content(*args, **kwargs):
+                    chunks.append(chunk)
+                    yield chunk
+            finally:
+                self.archive.record(request, response, b"".join(chunks))
+        response.iter_content = tee
+        return response
+
+def make_adapter(**kwargs) -> requests.adapters.HTTPAdapter:
+    return ArchiveAdapter(ARCHIVE, **kwargs) if ARCHIVE is not None else requests.adapters.HTTPAdapter(**kwargs)
+
+def make_session(pool_size: int = 10) -> requests.Session:
+    # One session per command, shared by all its threads so that connections to PyPI, GitHub
+    # and Snyk are reused across lookups. Hosts with a limit get an adapter of their own
+    # that makes threads wait for a free connection rather than open another.
+    session = PooledSession()
+    adapter = make_adapter(pool_connections=POOL_HOSTS, pool_maxsize=POOL_SIZE or pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    for host, limit in HOST_LIMITS.items():
+        host_adapter = make_adapter(pool_connections=1, pool_maxsize=limit, pool_block=True)
+        session.mount(f"https://{host}/", host_adapter)
+        session.mount(f"http://{host}/", host_adapter)
+    return session
+
+def make_client(limit: int = 100) -> "aiohttp.ClientSession":
+    # The asyncio counterpart of `make_session`, counting requests and connections the same way.
+    async def request_start(session, context, params) -> None:
+        context.host = params.url.host
+        with STATS_LOCK:
+            CONNECTION_STATS[context.host][0] += 1
+
+    async def connection_created(session, context, params) -> None:
+        with STATS_LOCK:
+            CONNECTION_STATS[context.host][1] += 1
+        if TRACE is not None and hasattr(context, "connecting"):
+            TRACE.add("connection", f"connect {context.host}", context.connecting, time.perf_counter(), TRACE.lane(), {})
+
+    async def connection_creating(session, context, params) -> None:
+        context.connecting = time.perf_counter()
+
+    async def resolving(session, context, params) -> None:
+        context.resolving = time.perf_counter()
+
+    async def resolved(session, context, params) -> None:
+        if TRACE is not None and hasattr(context, "resolving"):
+            TRACE.add("connection", f"DNS {params.host}", context.resolving, time.perf_counter(), TRACE.lane(), {})
+
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(request_start)
+    trace.on_connection_create_start.append(connection_creating)
+    trace.on_connection_create_end.append(connection_created)
+    trace.on_dns_resolvehost_start.append(resolving)
+    trace.on_dns_resolvehost_end.append(resolved)
+    connector = aiohttp.TCPConnector(limit=0, limit_per_host=POOL_SIZE or limit)
+    return aiohttp.ClientSession(connector=connector, trace_configs=[trace])
+
+def parse_host_limits(values, convert: type = int, unit: str = "CONNECTIONS") -> dict:
+    limits = {}
+    for value in values:
+        host, _, limit = value.partition("=")
+        try:
+            number = convert(limit)
+        except ValueError:
+            number = 0
+        if not host.strip() or not number > 0 or math.isinf(number):
+            raise ValueError(f"expected HOST={unit}, got {repr(value)}")
+        limits[host.strip().lower()] = number
+    return limits
+
+def record_transfer(url: str, wire_bytes: int | None, content: bytes) -> None:
+    with STATS_LOCK:
+        stats = CONNECTION_STATS[urlparse(url).hostname]
+        stats[2] += len(content) if wire_bytes is None else wire_bytes
+        stats[3] += len(content)
+
+def format_connection_stats() -> str:
+    lines = []
+    for host, (sent, opened, wire_bytes, body_bytes, retries) in sorted(CONNECTION_STATS.items()):
+        reused = max(sent - opened, 0)
+        lines.append(f"{host}: {sent} requests on {opened} connections ({reused} reused, {retries} retried), "
+                     f"{wire_bytes / 1024:.1f} KiB on the wire for {body_bytes / 1024:.1f} KiB of content"
+                     f" ({wire_bytes / max(sent, 1) / 1024:.1f} KiB per request)")
+    return "\n".join(lines + SCHEDULER.report()) or "No requests were sent."
+
+def read_requirements(path: str) -> list[str]:
+    # Requirement lines as pip reads them: continued lines joined, comments and per-requirement
+    # options (such as pip-compile's --hash lines) dropped, and lines whose marker excludes this
+    # environment left out. Lines that do not parse are kept for the caller to report.
+    requirements = []
+    content = Regex.LINE_CONTINUATION.sub(" ", pathlib.Path(path).read_text(encoding="utf-8"))
+    for line in content.splitlines():
+        line = Regex.REQUIREMENT_OPTIONS.sub("", line.split(" #", 1)[0]).strip()
+        if not line or line.startswith(("#", "-")):
+            continue
+        try:
+            marker = Requirement(line).marker
+        except InvalidRequirement:
+            marker = None
+        if marker is None or marker.evaluate({"extra": ""}):
+            requirements.append(line)
+    return requirements
+
+def parse_query(query: str, version: str | None = None) -> tuple[str, str | None]:
+    requirement = Requirement(query)
+    pins = [specifier.version for specifier in requirement.specifier if specifier.operator in ("==", "===")]
+    if len(pins) == 1 and "*" not in pins[0]:
+        version = pins[0]
+    return requirement.name, version
+
+def lookup_steps(query: str, version: str | None, backend: str = "json"):
+    query = yield from did_you_mean_steps(query)
+    package = yield from fetch_package_steps(query, version, backend)
+    if package is None:
+        return f"No such project named {repr(query)}{f' with version {repr(version)}' if version else ''} was found."
+    dependencies, optional_dependencies = yield from search_dependencies_steps(package, version)
+    return format_package(package, dependencies, optional_dependencies)
+
+def safe_lookup_steps(query: str, version: str | None, backend: str = "json"):
+    try:
+        name, version = parse_query(query, version)
+    except InvalidRequirement as exception:
+        return f"Invalid requirement {repr(query)}: {exception}"
+    try:
+        return (yield from lookup_steps(name, version, backend))
+    except Exception as exception: # one broken project must not end the whole batch
+        return f"Failed to look up {repr(query)}: {exception}"
+
+def supports_python(file: dict) -> bool:
+    try:
+        return not file.get("requires-python") or SpecifierSet(file["requires-python"]).contains(PYTHON_VERSION, prereleases=True)
+    except InvalidSpecifier:
+        return True # unparsable legacy metadata, as pip does
+
+def candidate_versions(page: dict, specifier: SpecifierSet) -> list[str]:
+    # Releases the specifier allows, newest first, leaving out those without a file for the
+    # running interpreter; releases whose files are all yanked come last (PEP 592).
+    files = collections.defaultdict(list)
+    for file in page["files"]:
+        if version := file_version(file["filename"]):
+            files[version].append(file)
+    versions = {}
+    for version, version_files in files.items():
+        try:
+            if any(supports_python(file) for file in version_files):
+                versions[Version(version)] = all(file.get("yanked") for file in version_files)
+        except InvalidVersion:
+            continue
+    allowed = specifier.filter(version for version, yanked in versions.items() if not yanked)
+    allowed_yanked = specifier.filter(version for version, yanked in versions.items() if yanked)
+    return [str(version) for version in sorted(allowed, reverse=True)] + [str(version) for version in sorted(allowed_yanked, reverse=True)]
+
+def pick_version(page: dict, requirement: Requirement) -> str | None:
+    versions = candidate_versions(page, requirement.specifier)
+    return versions[0] if versions else None
+
+def tree_requirements(dependencies: set, optional_dependencies: set | None, extras: set[str]) -> list[Requirement]:
+    lines = [(line, "") for line in dependencies]
+    extras = {normalize_name(extra) for extra in extras}
+    for extra, requirements in optional_dependencies or ():
+        if normalize_name(extra) in extras:
+            lines.extend((line, extra) for line in requirements)
+    requirements = []
+    for line, extra in lines:
+        try:
+            requirement = Requirement(line)
+        except InvalidRequirement:
+            continue # setup.py scraping can yield fragments that are not requirements
+        if requirement.marker is None or requirement.marker.evaluate({"extra": extra}):
+            requirements.append(requirement)
+    return sorted(requirements, key=lambda requirement: normalize_name(requirement.name))
+
+def tree_page_steps(name: str):
+    try:
+        return (yield from simple_project_steps(name))
+    except (requests.RequestException, ValueError, KeyError):
+        return None
+
+def tree_dependencies_steps(name: str, version: str, page: dict):
+    try:
+        return (yield from search_dependencies_steps({"Name": name, "Version": version}, version, page))
+    except Exception: # the project is left unexpanded rather than ending the tree
+        return None, None
+
+def dependency_tree_steps(query: str, version: str | None = None, max_depth: int | None = None):
+    # Breadth first: every level's project pages, then every level's metadata, are fetched
+    # as one concurrent batch. Both are memoized, so shared subtrees cost nothing extra.
+    requirement = Requirement(query)
+    requirement.name = yield from did_you_mean_steps(requirement.name)
+    if version:
+        requirement.specifier = SpecifierSet(f"=={version}")
+    root = {"name": requirement.name, "version": None, "requirement": str(requirement)}
+    pages, metadata, expanded = {}, {}, set()
+    level, depth = [(root, requirement, frozenset())], 0
+    while level:
+        names = list({normalize_name(requirement.name) for _, requirement, _ in level} - pages.keys())
+        pages.update(zip(names, (yield from gather_steps([tree_page_steps(name) for name in names]))))
+
+        expand = []
+        for node, requirement, ancestors in level:
+            name = normalize_name(requirement.name)
+            page = pages[name]
+            node["version"] = pick_version(page, requirement) if isinstance(page, dict) else None
+            key = (name, node["version"], frozenset(normalize_name(extra) for extra in requirement.extras))
+            if node["version"] is None:
+                node["unresolved"] = True
+            elif name in ancestors:
+                node["cycle"] = True
+            elif key in expanded:
+                node["repeated"] = True # already listed, at this depth or above
+            elif max_depth is None or depth < max_depth:
+                expanded.add(key)
+                expand.append((node, requirement, ancestors | {name}))
+
+        keys = list({(normalize_name(requirement.name), node["version"]) for node, requirement, _ in expand} - metadata.keys())
+        metadata.update(zip(keys, (yield from gather_steps([tree_dependencies_steps(name, version, pages[name]) for name, version in keys]))))
+
+        level, depth = [], depth + 1
+        for node, requirement, ancestors in expand:
+            result = metadata[(normalize_name(requirement.name), node["version"])]
+            dependencies, optional_dependencies = result if isinstance(result, tuple) else (None, None)
+            if dependencies is None:
+                node["unknown"] = True # no metadata and no source repository to read it from
+                continue
+            node["dependencies"] = []
+            for child_requirement in tree_requirements(dependencies, optional_dependencies, requirement.extras):
+                child = {"name": child_requirement.name, "version": None, "requirement": str(child_requirement)}
+                node["dependencies"].append(child)
+                level.append((child, child_requirement, ancestors))
+    return root
+
+def format_tree(node: dict, depth: int = 0) -> str:
+    notes = [note for key, note in (("unresolved", "no matching version"), ("cycle", "cycle"), ("repeated", "*"),
+                                    ("unknown", "dependencies unknown")) if node.get(key)]
+    string = f"{' '*2*depth}{node['name']} {node['version'] or '?'} ({node['requirement']})"
+    if notes:
+        string += f" [{', '.join(notes)}]"
+    for child in node.get("dependencies", ()):
+        string += "\n" + format_tree(child, depth + 1)
+    return string
+
+class MetadataIndex:
+    # Append-only `{"name", "version", "dependencies", "optional"}` lines: the requirements
+    # of a release never change, so the resolver keeps them across runs.
+    def __init__(self, path: pathlib.Path | None) -> None:
+        self.path = path
+        self.entries = {}
+        for entry in read_json_lines(path):
+            try:
+                self.entries[(entry["name"], entry["version"])] = (
+                    set(entry["dependencies"]), {(extra, tuple(lines)) for extra, lines in entry["optional"].items()})
+            except (KeyError, TypeError, AttributeError):
+                continue
+
+    def get(self, name: str, version: str) -> tuple[set, set] | None:
+        return self.entries.get((normalize_name(name), canonicalize_version(version)))
+
+    def add(self, name: str, version: str, dependencies: set, optional_dependencies: set | None) -> None:
+        key = (normalize_name(name), canonicalize_version(version))
+        self.entries[key] = dependencies, optional_dependencies or set()
+        append_json_lines(self.path, [{"name": key[0], "version": key[1], "dependencies": sorted(dependencies),
+                                       "optional": {extra: list(lines) for extra, lines in optional_dependencies or ()}}])
+
+def open_metadata_index() -> MetadataIndex:
+    return MetadataIndex(METADATA_INDEX_PATH)
+
+class Resolver:
+    # Depth-first backtracking over candidate versions, newest first. Requirements are
+    # taken in breadth-first order, and a choice is undone as soon as one of them cannot
+    # be met by the versions pinned so far. The steps it yields fetch project pages and
+    # the requirements of releases not in the metadata index.
+    def __init__(self, metadata_index: MetadataIndex, max_rounds: int = 10000) -> None:
+        self.metadata_index = metadata_index
+        self.max_rounds = max_rounds
+        self.pages, self.fetched = {}, set()
+        self.unknown = set() # releases whose requirements could not be found
+        self.stats, self.conflicts = collections.Counter(), collections.Counter()
+
+    def page_steps(self, name: str):
+        try:
+            return (yield from simple_project_steps(name))
+        except (ValueError, KeyError):
+            return None
+
+    def prefetch_steps(self, requirements: list[Requirement]):
+        # The pages of new requirements, and the metadata of the release each one would
+        # try first, are fetched as one concurrent batch before the search needs them.
+        names = list({normalize_name(requirement.name) for requirement in requirements} - self.pages.keys())
+        pages = yield from gather_steps([self.page_steps(name) for name in names])
+        for name, page in zip(names, pages):
+            if isinstance(page, requests.RequestException):
+                raise page # an unreachable page would pass for a project without releases
+            self.pages[name] = page
+        keys = set()
+        for requirement in requirements:
+            name = normalize_name(requirement.name)
+            if self.pages[name] is not None and (versions := candidate_versions(self.pages[name], requirement.specifier)):
+                if self.metadata_index.get(name, versions[0]) is None and (name, versions[0]) not in self.fetched:
+                    keys.add((name, versions[0]))
+        keys = list(keys)
+        results = yield from gather_steps([tree_dependencies_steps(name, version, self.pages[name]) for name, version in keys])
+        for (name, version), result in zip(keys, results):
+            self.fetched.add((name, version))
+            self.stats["metadata fetched"] += 1
+            if isinstance(result, tuple) and result[0] is not None:
+                self.metadata_index.add(name, version, *result)
+
+    def dependencies_steps(self, name: str, version: str, extras: frozenset, base: bool = True):
+        result = self.metadata_index.get(name, version)
+        if result is None and (name, version) not in self.fetched:
+            self.fetched.add((name, version))
+            self.stats["metadata fetched"] += 1
+            result = yield from tree_dependencies_steps(name, version, self.pages[name])
+            if result[0] is not None:
+                self.metadata_index.add(name, version, *result)
+        elif result is not None and (name, version) not in self.fetched:
+            self.stats["cache hits"] += 1
+        if result is None or result[0] is None:
+            self.unknown.add((name, version))
+            return []
+        dependencies, optional_dependencies = result
+        requirements = tree_requirements(dependencies if base else set(), optional_dependencies, extras)
+        yield from self.prefetch_steps(requirements)
+        return requirements
+
+    def solve_steps(self, pending: list[Requirement], pins: dict):
+        pending, pins = list(pending), dict(pins)
+        while pending: # requirements on pinned projects need no choice
+            requirement = pending.pop(0)
+            name = normalize_name(requirement.name)
+            if name not in pins:
+                break
+            display_name, version, extras = pins[name]
+            if not requirement.specifier.contains(version, prereleases=True):
+                self.conflicts[name] += 1
+                return None
+            if new_extras := frozenset(normalize_name(extra) for extra in requirement.extras) - extras:
+                pins[name] = display_name, version, extras | new_extras
+                pending += yield from self.dependencies_steps(name, version, new_extras, base=False)
+        else:
+            return pins
+
+        specifier = requirement.specifier
+        for other in pending: # later requirements on the same project narrow the candidates now
+            if normalize_name(other.name) == name:
+                specifier &= other.specifier
+        extras = frozenset(normalize_name(extra) for extra in requirement.extras)
+        for version in candidate_versions(self.pages[name], specifier) if self.pages.get(name) else ():
+            if self.stats["candidates tried"] >= self.max_rounds:
+                return None
+            self.stats["candidates tried"] += 1
+            dependencies = yield from self.dependencies_steps(name, version, extras)
+            result = yield from self.solve_steps(pending + dependencies, {**pins, name: (requirement.name, version, extras)})
+            if result is not None:
+                return result
+            self.stats["backtracks"] += 1
+        self.conflicts[name] += 1
+        return None
+
+    def resolve_steps(self, requirements: list[Requirement]):
+        requirements = [requirement for requirement in requirements
+                        if requirement.marker is None or requirement.marker.evaluate({"extra": ""})]
+        yield from self.prefetch_steps(requirements)
+        pins = yield from self.solve_steps(requirements, {})
+        if pins is None:
+            return None
+        return {display_name: version for display_name, version, _ in pins.values()}
+
+    def summary(self) -> str:
+        return (f"{self.stats['candidates tried']} candidates tried, {self.stats['backtracks']} backtracks, "
+                f"{self.stats['cache hits']} metadata cache hits, {self.stats['metadata fetched']} fetched, "
+                f"{len(self.pages)} project pages")
+
+def safe_dependency_tree_steps(query: str, version: str | None = None, max_depth: int | None = None, output: str = "text"):
+    try:
+        tree = yield from dependency_tree_steps(query, version, max_depth)
+    except InvalidRequirement as exception:
+        return f"Invalid requirement {repr(query)}: {exception}"
+    except Exception as exception:
+        return f"Failed to look up {repr(query)}: {exception}"
+    return json.dumps(tree, indent=2) if output == "json" else format_tree(tree)
+
+def build_response(url: str, status: int, reason: str, headers, content: bytes) -> requests.Response:
+    response = requests.Response()
+    response.url, response.status_code, response.reason = url, status, reason
+    response.headers = requests.structures.CaseInsensitiveDict(headers)
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    response._content = content
+    return response
+
+def cache_control(headers) -> dict[str, str | None]:
+    directives = {}
+    for directive in headers.get("Cache-Control", "").split(","):
+        key, _, value = directive.strip().partition("=")
+        if key:
+            directives[key.lower()] = value.strip('"') or None
+    return directives
+
+def freshness_deadline(headers, now: float, immutable: bool = False) -> float | None:
+    directives = cache_control(headers)
+    if immutable or "immutable" in directives:
+        return None # never expires
+    if "no-cache" in directives:
+        return 0.0
+    for key in ("s-maxage", "max-age"):
+        if directives.get(key, "").isdigit():
+            age = int(headers["Age"]) if headers.get("Age", "").isdigit() else 0
+            return now + int(directives[key]) - age
+    if headers.get("Expires") and headers.get("Date"):
+        try:
+            expires = email.utils.parsedate_to_datetime(headers["Expires"])
+            date = email.utils.parsedate_to_datetime(headers["Date"])
+            return now + (expires - date).total_seconds()
+        except (TypeError, ValueError):
+            pass
+    return 0.0 # no explicit freshness, revalidate on every use
+
+class CacheEntry:
+    def __init__(self, path: pathlib.Path, meta: dict, content: bytes) -> None:
+        # Header names keep the spelling they were received in: aiohttp reports "Etag".
+        meta["headers"] = requests.structures.CaseInsensitiveDict(meta["headers"])
+        self.path, self.meta, self.content = path, meta, content
+
+    @property
+    def fresh(self) -> bool:
+        return self.meta["expires"] is None or self.meta["expires"] > time.time()
+
+    def revalidation_headers(self, headers: dict) -> dict:
+        headers = dict(headers)
+        if "ETag" in self.meta["headers"]:
+            headers["If-None-Match"] = self.meta["headers"]["ETag"]
+        if "Last-Modified" in self.meta["headers"]:
+            headers["If-Modified-Since"] = self.meta["headers"]["Last-Modified"]
+        return headers
+
+    def response(self) -> requests.Response:
+        status = self.meta.get("status", 200)
+        return build_response(self.meta["url"], status, http.HTTPStatus(status).phrase, self.meta["headers"], self.content)
+
+class HTTPCache:
+    # Headers describing the transfer rather than the stored (already decoded) body.
+    TRANSFER_HEADERS = ("Content-Encoding", "Content-Length", "Transfer-Encoding", "Connection", "Keep-Alive")
+    MAX_BODY_SIZE = 8 * 1024 * 1024 # whole distributions are not worth keeping
+
+    def __init__(self, directory: pathlib.Path) -> None:
+        self.directory = directory
+
+    def path(self, request: Get) -> pathlib.Path:
+        url = f"{request.url}?{urlencode(request.params)}" if request.params else request.url
+        key = hashlib.sha256(f"{url}\n{request.headers.get('Accept', '')}\n{request.headers.get('Range', '')}".encode()).hexdigest()
+        return self.directory / key[:2] / key
+
+    def load(self, request: Get) -> CacheEntry | None:
+        path = self.path(request)
+        try:
+            meta = json.loads(path.with_suffix(".json").read_text(encoding="utf-8"))
+            content = path.with_suffix(".body").read_bytes()
+        except (OSError, ValueError):
+            return None
+        return CacheEntry(path, meta, content)
+
+    def write(self, path: pathlib.Path, meta: dict, content: bytes | None = None) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        if content is not None:
+            path.with_suffix(suffix).write_bytes(content)
+            os.replace(path.with_suffix(suffix), path.with_suffix(".body"))
+        path.with_suffix(suffix).write_text(json.dumps(meta, default=dict), encoding="utf-8")
+        os.replace(path.with_suffix(suffix), path.with_suffix(".json"))
+
+    def store(self, request: Get, response: requests.Response, entry: CacheEntry | None = None) -> requests.Response:
+        now = time.time()
+        try:
+            if response.status_code == 304 and entry is not None:
+                entry.meta["headers"].update(
+                    (key, response.headers[key]) for key in ("Cache-Control", "Expires", "Date", "Age", "ETag", "Last-Modified")
+                    if key in response.headers
+                )
+                entry.meta["expires"] = freshness_deadline(entry.meta["headers"], now, request.immutable)
+                self.write(entry.path, entry.meta)
+                return entry.response()
+            # A file missing at an immutable URL (a commit) stays missing, so the 404 is kept too.
+            cacheable = (200, 206, 404) if request.immutable else (200, 206)
+            if response.status_code not in cacheable or "no-store" in cache_control(response.headers) or \
+               len(response.content) > self.MAX_BODY_SIZE:
+                return response
+            headers = requests.structures.CaseInsensitiveDict(response.headers)
+            for key in self.TRANSFER_HEADERS:
+                headers.pop(key, None)
+            expires = freshness_deadline(headers, now, request.immutable)
+            if expires == 0.0 and "ETag" not in headers and "Last-Modified" not in headers:
+                return response # could neither be reused nor revalidated
+            self.write(self.path(request), {"url": response.url, "status": response.status_code, "headers": headers,
+                                            "expires": expires}, response.content)
+        except OSError:
+            pass # the cache is best effort, a read-only or full disk must not break lookups
+        return response
+
+HTTP_CACHE: HTTPCache | None = HTTPCache(CACHE_DIR / "http")
+
+class DeadlineExceeded(requests.Timeout):
+    pass
+
+def remaining_time() -> float | None:
+    # Seconds left before the command's deadline, None without one.
+    if DEADLINE is None:
+        return None
+    if (remaining := DEADLINE - time.monotonic()) <= 0:
+        raise DeadlineExceeded("the deadline for network requests has passed")
+    return remaining
+
+def request_timeouts() -> tuple[float, float]:
+    remaining = remaining_time()
+    if remaining is None:
+        return CONNECT_TIMEOUT, READ_TIMEOUT
+    return min(CONNECT_TIMEOUT, remaining), min(READ_TIMEOUT, remaining)
+
+class HostState:
+    # Admission state of one host, guarded by the scheduler's condition. The window of
+    # requests in flight grows by one per answer until the first sign of congestion (slow
+    # start), then by one per window of answers while they stay fast, and halves at most once
+    # per window on 429/503 answers and failed connections.
+    def __init__(self, ceiling: int, rate: float | None):
+        self.ceiling, self.rate = ceiling, rate
+        self.window, self.slow_start = float(min(INITIAL_CONCURRENCY, ceiling)), True
+        self.tokens, self.refilled = max(rate or 0.0, 1.0), time.monotonic()
+        self.paused_until = self.decreased_at = 0.0
+        self.fastest: float | None = None
+        self.latencies = collections.deque(maxlen=256) # times to the response headers
+        self.active = self.waiting = self.peak_waiting = self.sent = self.throttled = self.decreases = 0
+        self.hedged = self.hedges_won = 0
+        self.queued = 0.0 # seconds requests spent waiting for admission
+
+    def admission_delay(self, now: float) -> float:
+        # 0.0 when a request is admitted now, otherwise the seconds until it is worth asking
+        # again (infinite until a request in flight finishes).
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.active >= max(int(self.window), 1):
+            return math.inf
+        if self.rate:
+            self.tokens = min(max(self.rate, 1.0), self.tokens + (now - self.refilled) * self.rate)
+            self.refilled = now
+            if self.tokens < 1.0:
+                return (1.0 - self.tokens) / self.rate
+            self.tokens -= 1.0
+        self.active += 1
+        self.sent += 1
+        return 0.0
+
+    def observe(self, started: float, now: float, status: int | None, latency: float | None, pause: float | None) -> None:
+        self.active -= 1
+        latency = now - started if latency is None else latency
+        if status is not None:
+            self.latencies.append(latency)
+        if status is None or status in (429, 503):
+            self.throttled += status == 429
+            if pause:
+                self.paused_until = max(self.paused_until, now + min(pause, MAX_RETRY_AFTER))
+            if started >= self.decreased_at: # requests sent before the last decrease saw the old window
+                self.window, self.slow_start, self.decreased_at = max(self.window / 2, 1.0), False, now
+                self.decreases += 1
+            return
+        self.fastest = latency if self.fastest is None else min(latency, self.fastest * 1.01) # let it drift up slowly
+        if latency > LATENCY_TOLERANCE * self.fastest + 0.001:
+            self.slow_start = False # the host, or the path to it, is queueing
+        else:
+            self.window = min(float(self.ceiling), self.window + (1.0 if self.slow_start else 1.0 / self.window))
+
+class HostScheduler:
+    # Every request is admitted here before it is sent, so that both engines respect the same
+    # per-host limits: a token bucket for HOST_RATES and an AIMD window of requests in flight,
+    # capped by HOST_LIMITS (HOST_CONCURRENCY for other hosts), paused by Retry-After.
+    def __init__(self):
+        self.hosts: dict[str, HostState] = {}
+        self.condition = threading.Condition()
+        self.async_waiters = []
+
+    def state(self, host: str) -> HostState:
+        if (state := self.hosts.get(host)) is None:
+            state = self.hosts[host] = HostState(HOST_LIMITS.get(host, HOST_CONCURRENCY), HOST_RATES.get(host))
+        else: # the limits are read on every request, like the rest of the configuration
+            state.ceiling, state.rate = HOST_LIMITS.get(host, HOST_CONCURRENCY), HOST_RATES.get(host)
+            state.window = min(state.window, float(state.ceiling))
+        return state
+
+    def enqueue(self, host: str) -> HostState:
+        state = self.state(host)
+        state.waiting += 1
+        state.peak_waiting = max(state.peak_waiting, state.waiting)
+        return state
+
+    def dequeue(self, state: HostState, since: float) -> float:
+        now = time.monotonic()
+        state.waiting -= 1
+        state.queued += now - since
+        return now
+
+    def wait_time(self, state: HostState, host: str, deadline: float | None) -> float:
+        # 0.0 once a request is admitted, otherwise how long to wait before asking again.
+        now = time.monotonic()
+        if (delay := state.admission_delay(now)) == 0:
+            return 0.0
+        if deadline is not None:
+            if now >= deadline:
+                raise DeadlineExceeded(f"the deadline passed while waiting to send a request to {host}")
+            delay = min(delay, deadline - now)
+        return delay
+
+    def acquire(self, host: str, deadline: float | None = None) -> float:
+        # Blocks until a request to `host` may be sent, returns when it was admitted.
+        with self.condition:
+            state, since = self.enqueue(host), time.monotonic()
+            try:
+                while (delay := self.wait_time(state, host, deadline)) > 0:
+                    self.condition.wait(None if delay == math.inf else delay)
+            finally:
+                started = self.dequeue(state, since)
+        return started
+
+    async def acquire_async(self, host: str, deadline: float | None = None) -> float:
+        loop = asyncio.get_running_loop()
+        with self.condition:
+            state, since = self.enqueue(host), time.monotonic()
+        try:
+            while True:
+                with self.condition:
+                    if (delay := self.wait_time(state, host, deadline)) == 0:
+                        break
+                    waiter = loop.create_future()
+                    self.async_waiters.append((loop, waiter))
+                await asyncio.wait([waiter], timeout=None if delay == math.inf else delay)
+        finally:
+            with self.condition:
+                started = self.dequeue(state, since)
+        return started
+
+    def try_acquire(self, host: str) -> float | None:
+        # Admits a hedged request only if it need not wait.
+        with self.condition:
+            state = self.state(host)
+            if state.admission_delay(time.monotonic()) > 0:
+                return None
+            state.hedged += 1
+            return time.monotonic()
+
+    def hedge_threshold(self, host: str) -> float | None:
+        with self.condition:
+            latencies = sorted(self.state(host).latencies)
+        if len(latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        return latencies[min(int(len(latencies) * HEDGE_PERCENTILE), len(latencies) - 1)]
+
+    def hedge_won(self, host: str) -> None:
+        with self.condition:
+            self.hosts[host].hedges_won += 1
+
+    def release(self, host: str, started: float, status: int | None, latency: float | None = None, headers=None) -> None:
+        # `status` is None when no answer came; `latency` is the time to the response headers.
+        with self.condition:
+            self.hosts[host].observe(started, time.monotonic(), status, latency, retry_after(headers))
+            self.wake()
+
+    def abandon(self, host: str) -> None:
+        # A request given up before its answer (a losing hedge) tells nothing about the host.
+        with self.condition:
+            self.hosts[host].active -= 1
+            self.wake()
+
+    def wake(self) -> None:
+        with self.condition:
+            self.condition.notify_all()
+            waiters, self.async_waiters = self.async_waiters, []
+        for loop, waiter in waiters:
+            try:
+                loop.call_soon_threadsafe(lambda waiter=waiter: waiter.done() or waiter.set_result(None))
+            except RuntimeError:
+                pass # its event loop is closed
+
+    def report(self) -> list[str]:
+        with self.condition:
+            return [f"{host}: window {state.window:.1f} of {state.ceiling}"
+                    f"{f' at {state.rate:g} requests/s' if state.rate else ''}, {state.decreases} decreases,"
+                    f" {state.throttled} throttled, queue peaked at {state.peak_waiting}"
+                    f" ({state.queued / max(state.sent, 1) * 1000:.1f} ms queued per request)"
+                    f"{f', {state.hedged} hedged ({state.hedges_won} won)' if state.hedged else ''}"
+                    for host, state in sorted(self.hosts.items())]
+
+SCHEDULER = HostScheduler()
+
+def stream_into(response: requests.Response, consumer: Callable[[bytes], bool]) -> bool:
+    chunks = []
+    for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+        chunks.append(chunk)
+        if consumer(chunk):
+            response.close() # drop the connection instead of draining the rest of the body
+            response._content = b"".join(chunks)
+            return False
+        if DEADLINE is not None and time.monotonic() >= DEADLINE: # the read timeout only bounds each read
+            response.close()
+            raise DeadlineExceeded(f"the deadline passed while reading {response.url}")
+    response._content = b"".join(chunks)
+    return True
+
+def replay_into(request: Get, response: requests.Response) -> requests.Response:
+    if request.consumer is not None and response.status_code == 200:
+        content = memoryview(response.content)
+        for start in range(0, len(content), STREAM_CHUNK_SIZE):
+            if request.consumer(content[start:start + STREAM_CHUNK_SIZE].tobytes()):
+                break
+    return response
+
+def retry_after(headers) -> float | None:
+    # The server's Retry-After in seconds from now, given as seconds or as an HTTP date.
+    value = (headers or {}).get("Retry-After", "").strip()
+    if not value:
+        return None
+    try:
+        delay = float(value) if value.isdigit() else email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+    except (TypeError, ValueError, OverflowError):
+        return None
+    return max(delay, 0.0)
+
+def retry_delay(attempt: int, headers=None) -> float | None:
+    # Seconds to wait before retrying, or None to give up: the server's Retry-After if it
+    # sent one, otherwise exponential backoff with full jitter.
+    if attempt >= MAX_RETRIES:
+        return None
+    if (delay := retry_after(headers)) is None:
+        delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+    elif delay > MAX_RETRY_AFTER:
+        return None
+    if DEADLINE is not None and time.monotonic() + delay >= DEADLINE:
+        return None # the retry could not be sent in time
+    return delay
+
+def record_retry(url: str) -> None:
+    with STATS_LOCK:
+        CONNECTION_STATS[urlparse(url).hostname][4] += 1
+
+def wire_bytes(response: requests.Response) -> int | None:
+    # urllib3 counts the (still encoded) body bytes it read off the socket.
+    try:
+        return int(response.raw.tell())
+    except (AttributeError, TypeError, ValueError, OSError):
+        return None
+
+def send(session: requests.Session, request: Get, headers: dict, host: str, started: float | None = None) -> requests.Response:
+    # One attempt, admitted by the scheduler unless `started` says when it already was.
+    started = SCHEDULER.acquire(host, DEADLINE) if started is None else started
+    try:
+        response = session.get(request.url, params=request.params, headers=headers,
+                               stream=request.consumer is not None, timeout=request_timeouts())
+    except NotRecorded: # no answer in the archive says nothing about the host
+        SCHEDULER.abandon(host)
+        raise
+    except BaseException:
+        SCHEDULER.release(host, started, None)
+        raise
+    SCHEDULER.release(host, started, response.status_code, response.elapsed.total_seconds(), response.headers)
+    return response
+
+@functools.cache
+def hedge_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="pip-ext-hedge")
+
+def discard_response(future) -> None:
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+def hedged_send(session: requests.Session, request: Get, headers: dict, host: str) -> requests.Response:
+    # Once a request has waited longer than most answers of its host take, a copy is sent if
+    # the scheduler has room for it right away; whichever answers first is used.
+    threshold = SCHEDULER.hedge_threshold(host) if HEDGE else None
+    if threshold is None:
+        return send(session, request, headers, host)
+    first = hedge_executor().submit(send, session, request, headers, host)
+    wait_futures([first], timeout=threshold)
+    if first.done() or (started := SCHEDULER.try_acquire(host)) is None:
+        return first.result()
+    second = hedge_executor().submit(send, session, request, headers, host, started)
+    pending = {first, second}
+    while pending:
+        done, pending = wait_futures(pending, return_when=FIRST_COMPLETED)
+        if winner := next((future for future in done if future.exception() is None), None):
+            for loser in {first, second} - {winner}:
+                loser.add_done_callback(discard_response)
+            if winner is second:
+                SCHEDULER.hedge_won(host)
+            return winner.result()
+    return first.result() # both failed
+
+def traced(details: dict, response: requests.Response, cache: str) -> requests.Response:
+    details.update(status=response.status_code, bytes=len(response.content), cache=cache)
+    return response
+
+def fetch(session: requests.Session, request: Get) -> requests.Response:
+    host = urlparse(request.url).netloc
+    with span("http", f"GET {host}", url=request.url) as details:
+        entry = HTTP_CACHE.load(request) if HTTP_CACHE else None
+        if entry is not None and entry.fresh:
+            return traced(details, replay_into(request, entry.response()), "hit")
+        headers = entry.revalidation_headers(request.headers) if entry else request.headers
+        for attempt in itertools.count(): # GETs are idempotent, throttling and transient failures are retried
+            try:
+                response = hedged_send(session, request, headers, host)
+            except (requests.ConnectionError, requests.Timeout):
+                if (delay := retry_delay(attempt)) is None:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or (delay := retry_delay(attempt, response.headers)) is None:
+                    break
+                response.close()
+            record_retry(request.url)
+            details["retries"] = attempt + 1
+            time.sleep(delay)
+        cache = "off" if HTTP_CACHE is None else "revalidated" if entry is not None and response.status_code == 304 else "miss"
+        if request.consumer is not None and response.status_code == 200:
+            complete = stream_into(response, request.consumer)
+            record_transfer(response.url, wire_bytes(response), response.content)
+            if not complete:
+                return traced(details, response, cache) # stopped early, the truncated body must not be cached
+            return traced(details, HTTP_CACHE.store(request, response, entry) if HTTP_CACHE else response, cache)
+        content = response.content # reads a streamed body off the socket before it is measured
+        record_transfer(response.url, wire_bytes(response), content)
+        return traced(details, replay_into(request, HTTP_CACHE.store(request, response, entry) if HTTP_CACHE else response), cache)
+
+async def send_async(client: "aiohttp.ClientSession", request: Get, headers: dict, host: str,
+                     started: float | None = None) -> "aiohttp.ClientResponse":
+    started = await SCHEDULER.acquire_async(host, DEADLINE) if started is None else started
+    connect, read = request_timeouts()
+    timeout = aiohttp.ClientTimeout(total=remaining_time(), sock_connect=connect, sock_read=read)
+    try:
+        reply = await client.get(request.url, params=request.params, headers=headers, timeout=timeout)
+    except asyncio.CancelledError:
+        SCHEDULER.abandon(host)
+        raise
+    except BaseException:
+        SCHEDULER.release(host, started, None)
+        raise
+    SCHEDULER.release(host, started, reply.status, time.monotonic() - started, reply.headers)
+    return reply
+
+def discard_reply(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is None:
+        task.result().close()
+
+async def hedged_send_async(client: "aiohttp.ClientSession", request: Get, headers: dict, host: str) -> "aiohttp.ClientResponse":
+    threshold = SCHEDULER.hedge_threshold(host) if HEDGE else None
+    if threshold is None:
+        return await send_async(client, request, headers, host)
+    first = asyncio.ensure_future(send_async(client, request, headers, host))
+    await asyncio.wait([first], timeout=threshold)
+    if first.done() or (started := SCHEDULER.try_acquire(host)) is None:
+        return await first
+    second = asyncio.ensure_future(send_async(client, request, headers, host, started))
+    pending = {first, second}
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        if winner := next((task for task in done if task.exception() is None), None):
+            for loser in {first, second} - {winner}:
+                loser.add_done_callback(discard_reply)
+                loser.cancel()
+            if winner is second:
+                SCHEDULER.hedge_won(host)
+            return winner.result()
+    return await first # both failed
+
+async def fetch_async(client: "aiohttp.ClientSession", request: Get) -> requests.Response:
+    host = urlparse(request.url).netloc
+    with span("http", f"GET {host}", url=request.url) as details:
+        entry = HTTP_CACHE.load(request) if HTTP_CACHE else None
+        if entry is not None and entry.fresh:
+            return traced(details, replay_into(request, entry.response()), "hit")
+        headers = entry.revalidation_headers(request.headers) if entry else request.headers
+        if headers.get("Accept-Encoding") != "identity": # aiohttp advertises what its own decoders can read
+            headers = {key: value for key, value in headers.items() if key != "Accept-Encoding"}
+        complete, chunks = True, []
+        for attempt in itertools.count():
+            try:
+                async with await hedged_send_async(client, request, headers, host) as reply:
+                    if reply.status not in RETRY_STATUSES or (delay := retry_delay(attempt, reply.headers)) is None:
+                        if request.consumer is not None and reply.status == 200:
+                            async for chunk in reply.content.iter_chunked(STREAM_CHUNK_SIZE):
+                                chunks.append(chunk)
+                                if request.consumer(chunk):
+                                    reply.close() # drop the connection instead of draining the rest of the body
+                                    complete = False
+                                    break
+                            content = b"".join(chunks)
+                        else:
+                            content = await reply.read()
+                        break
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if chunks or (delay := retry_delay(attempt)) is None: # the consumer has already seen part of the body
+                    raise
+            record_retry(request.url)
+            details["retries"] = attempt + 1
+            await asyncio.sleep(delay)
+        record_transfer(str(reply.url), getattr(reply.content, "total_raw_bytes", None), content)
+        response = build_response(str(reply.url), reply.status, reply.reason, reply.headers, content)
+        cache = "off" if HTTP_CACHE is None else "revalidated" if entry is not None and reply.status == 304 else "miss"
+        if request.consumer is not None and reply.status == 200:
+            return traced(details, HTTP_CACHE.store(request, response, entry) if HTTP_CACHE and complete else response, cache)
+        return traced(details, replay_into(request, HTTP_CACHE.store(request, response, entry) if HTTP_CACHE else response), cache)
+
+# The lookup pipeline is written as generators ("steps") that yield `Get` requests and
+# are sent back the responses, so the same code is driven by the blocking `requests`
+# engine below and by the asyncio engine further down. A step may also yield a list of
+# independent `Get`s; they are fetched concurrently and it is sent back a list holding a
+# response or the `requests` exception for each of them, in order.
+
+def gather_steps(steps_list: list):
+    # Drives several steps in lockstep, batching whatever they request next, and returns
+    # their results in order; a step that raised a `requests` exception returns it instead.
+    results = [None] * len(steps_list)
+    replies = {index: (None, None) for index in range(len(steps_list))}
+    # Steps run interleaved, so their spans would overlap without nesting on a shared lane.
+    lanes = TRACE.step_lanes(len(steps_list)) if TRACE is not None else [None] * len(steps_list)
+    while replies:
+        pending = {}
+        for index, (response, exception) in replies.items():
+            try:
+                steps = steps_list[index]
+                with on_lane(lanes[index]):
+                    pending[index] = steps.throw(exception) if exception else steps.send(response)
+            except StopIteration as stop:
+                results[index] = stop.value
+            except requests.RequestException as error:
+                results[index] = error
+        if not pending:
+            break
+        responses = yield [request for pending_request in pending.values()
+                           for request in (pending_request if isinstance(pending_request, list) else [pending_request])]
+        replies, position = {}, 0
+        for index, request in pending.items():
+            if isinstance(request, list):
+                replies[index] = responses[position:position + len(request)], None
+                position += len(request)
+            else:
+                response = responses[position]
+                replies[index] = (None, response) if isinstance(response, requests.RequestException) else (response, None)
+                position += 1
+    if lanes and lanes[0] is not None:
+        TRACE.release_step_lanes(lanes)
+    return results
+
+def fetch_all(session: requests.Session, batch: list[Get]) -> list[requests.Response | requests.RequestException]:
+    def attempt(request: Get):
+        try:
+            return fetch(session, request)
+        except requests.RequestException as error:
+            return error
+    with ThreadPoolExecutor(max_workers=max(1, min(len(batch), MAX_BATCH_WORKERS))) as executor:
+        return list(executor.map(attempt, batch))
+
+def run_steps(session: requests.Session, steps):
+    response = exception = None
+    while True:
+        try:
+            request = steps.throw(exception) if exception else steps.send(response)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            response = fetch_all(session, request) if isinstance(request, list) else fetch(session, request)
+            exception = None
+        except requests.RequestException as error:
+            response, exception = None, error
+
+def did_you_mean(session: requests.Session, query: str) -> str:
+    return run_steps(session, did_you_mean_steps(query))
+
+def search_dependencies(session: requests.Session, package: dict[str, str], version: str):
+    return run_steps(session, search_dependencies_steps(package, version))
+
+def fetch_package_json(session: requests.Session, name: str, version: str) -> dict | None:
+    return run_steps(session, fetch_package_json_steps(name, version))
+
+def fetch_package_html(session: requests.Session, name: str, version: str) -> dict | None:
+    return run_steps(session, fetch_package_html_steps(name, version))
+
+def fetch_package(session: requests.Session, name: str, version: str, backend: str = "json") -> dict | None:
+    return run_steps(session, fetch_package_steps(name, version, backend))
+
+def lookup(session: requests.Session, query: str, version: str | None, backend: str = "json") -> str:
+    return run_steps(session, lookup_steps(query, version, backend))
+
+def search_many(session: requests.Session, queries: list[tuple[str, str | None]], backend: str = "json", jobs: int = 8):
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        yield from executor.map(lambda query: run_steps(session, safe_lookup_steps(*query, backend)), queries)
+
+async def fetch_all_async(client: "aiohttp.ClientSession", batch: list[Get]) -> list[requests.Response | requests.RequestException]:
+    async def attempt(request: Get):
+        try:
+            return await fetch_async(client, request)
+        except aiohttp.ClientError as error:
+            return requests.ConnectionError(error)
+        except asyncio.TimeoutError:
+            return requests.Timeout(f"{request.url} timed out")
+        except requests.RequestException as error: # the deadline passed
+            return error
+    return list(await asyncio.gather(*map(attempt, batch)))
+
+async def run_steps_async(client: "aiohttp.ClientSession", steps):
+    response = exception = None
+    while True:
+        try:
+            request = steps.throw(exception) if exception else steps.send(response)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            response = await (fetch_all_async(client, request) if isinstance(request, list) else fetch_async(client, request))
+            exception = None
+        except aiohttp.ClientError as error:
+            response, exception = None, requests.ConnectionError(error) # steps only know `requests` errors
+        except asyncio.TimeoutError:
+            response, exception = None, requests.Timeout(f"{request.url} timed out")
+        except requests.RequestException as error:
+            response, exception = None, error
+
+async def lookup_async(client: "aiohttp.ClientSession", query: str, version: str | None, backend: str = "json") -> str:
+    return await run_steps_async(client, lookup_steps(query, version, backend))
+
+async def search_many_async(queries: list[tuple[str, str | None]], backend: str = "json", limit: int = 100) -> list[str]:
+    if aiohttp is None:
+        raise RuntimeError("the asyncio engine requires aiohttp (pip install 'pip-ext[async]')")
+    async with make_client(limit) as client:
+        return await asyncio.gather(*(run_steps_async(client, safe_lookup_steps(*query, backend)) for query in queries))
+
+def search(args) -> None:
+    queries = list(args.query)
+    for path in args.requirements or ():
+        queries.extend(read_requirements(path))
+    if not queries:
+        raise SystemExit("pip-ext search: error: no query or requirements file given")
+    if args.tree:
+        return search_trees(args, queries)
+    queries = [(query, args.version) for query in queries] # each is parsed and reported on its own
+
+    jobs = max(1, min(args.jobs, len(queries)))
+    if args.use_async:
+        if aiohttp is None:
+            raise SystemExit("pip-ext search: error: --async requires aiohttp (pip install 'pip-ext[async]')")
+        results = asyncio.run(search_many_async(queries, args.backend, limit=jobs))
+        print("\n---\n".join(results))
+        return
+
+    session = make_session(pool_size=jobs)
+    try:
+        for index, result in enumerate(search_many(session, queries, args.backend, jobs)):
+            if index:
+                print("---")
+            print(result)
+    finally:
         session.close()
-        string = "\n".join(
-            (f"{key}: {value}" for key, value in html_parser.package.items() if key != "Links")
-        )
-        if "Links" in html_parser.package:
-            string += f"\nLinks:\n{' '*2}" + f"\n{' '*2}".join((f"{key}: {value}" for key, value in html_parser.package["Links"]))
-        if dependencies:
-            string += f"\nDependencies: {dependencies}"
-        if optional_dependencies:
-            string += f"\nOptional Dependencies:"
-            for identifier, packages in optional_dependencies:
-                string += f"\n{' '*4}{repr(identifier):<10} --> {repr(packages)}"
-        print(string)
+
+def search_trees(args, queries: list[str]) -> None:
+    trees = [safe_dependency_tree_steps(query, args.version, args.depth, args.format) for query in queries]
+    if args.use_async:
+        if aiohttp is None:
+            raise SystemExit("pip-ext search: error: --async requires aiohttp (pip install 'pip-ext[async]')")
+        async def gather_trees() -> list[str]:
+            async with make_client(args.jobs) as client:
+                return [await run_steps_async(client, steps) for steps in trees]
+        results = asyncio.run(gather_trees())
+    else:
+        with make_session(pool_size=args.jobs) as session:
+            results = [run_steps(session, steps) for steps in trees]
+    print("\n---\n".join(results))
+
+def resolve(args) -> None:
+    lines = list(args.requirement_specifiers)
+    for path in args.requirements or ():
+        lines.extend(read_requirements(path))
+    if not lines:
+        raise SystemExit("pip-ext resolve: error: no requirement or requirements file given")
+    try:
+        requirements = [Requirement(line) for line in lines]
+    except InvalidRequirement as exception:
+        raise SystemExit(f"pip-ext resolve: error: {exception}")
+
+    resolver = Resolver(open_metadata_index(), args.max_rounds)
+    try:
+        with make_session(pool_size=args.jobs) as session:
+            pins = run_steps(session, resolver.resolve_steps(requirements))
+    except requests.RequestException as exception:
+        raise SystemExit(f"pip-ext resolve: error: {exception}\n# {resolver.summary()}")
+    if pins is None:
+        conflicts = ", ".join(name for name, _ in resolver.conflicts.most_common(5))
+        reason = "gave up after --max-rounds candidates" if resolver.stats["candidates tried"] >= args.max_rounds else \
+                 "no consistent set of versions exists"
+        raise SystemExit(f"pip-ext resolve: error: {reason} (most conflicts: {conflicts or 'none'})\n# {resolver.summary()}")
+    for name, version in sorted(pins.items(), key=lambda item: normalize_name(item[0])):
+        print(f"{name}=={version}")
+    pinned = {(normalize_name(name), version) for name, version in pins.items()}
+    for name, version in sorted(resolver.unknown & pinned):
+        print(f"# the requirements of {name}=={version} could not be found and were assumed empty")
+    print(f"# {resolver.summary()}")
 
 def careful_install(args):
     requirement_specifier: str = args.requirement_specifier
     requirement = Requirement(requirement_specifier)
     
-    session = requests.Session()
-
-    name = did_you_mean(session, requirement.name)
-    if name != requirement.name:
-        requirement.name = name
+    with make_session() as session:
+        name = did_you_mean(session, requirement.name)
+        if name != requirement.name:
+            requirement.name = name
 
-    response = session.get(url=f"https://snyk.io/advisor/python/{requirement.name}/", headers=HEADERS)
-    content = response.content.decode("utf-8")
+        try:
+            response = fetch(session, Get(f"https://snyk.io/advisor/python/{requirement.name}/"))
+            if response.status_code != 404:
+                response.raise_for_status()
+        except requests.RequestException as exception:
+            raise SystemExit(f"pip-ext careful-install: error: {exception}")
+        content = response.content.decode("utf-8", errors="replace")
 
-    if content.find("Project Not found") != -1:
+    if response.status_code == 404 or content.find("Project Not found") != -1:
         print(f"No such project named {repr(requirement.name)} was found.")
     else:
         html_parser = SnykAdvisorHTMLParser()
         html_parser.feed(content)
         print(html_parser.package_health)
 
+def open_index_for_update() -> SimpleIndexMirror:
+    INDEX_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with INDEXES_LOCK:
+        INDEXES.pop(INDEX_PATH, None) # reopened (and checked for staleness) on next use
+    return SimpleIndexMirror(INDEX_PATH)
+
+def index_build(args):
+    with make_session() as session:
+        projects, serial = run_steps(session, simple_root_steps())
+    mirror = open_index_for_update()
+    count = mirror.replace_projects(projects, serial)
+    mirror.close()
+    print(f"Indexed {count} project names in {INDEX_PATH}")
+
+def index_sync(args):
+    mirror = open_index_for_update()
+    with make_session(pool_size=args.jobs) as session:
+        projects, serial = run_steps(session, simple_root_steps())
+        added, removed, stale_pages = mirror.update_projects(projects, serial)
+        refresh = sorted(set(stale_pages) | {normalize_name(project) for project in args.projects})
+        with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+            pages = list(executor.map(lambda name: run_steps(session, simple_project_steps(name, mirror)), refresh))
+    mirror.close()
+    missing = [name for name, page in zip(refresh, pages) if page is None]
+    print(f"Synced {INDEX_PATH} to serial {serial}: {added} projects added, {removed} removed, "
+          f"{len(refresh) - len(missing)} project pages checked")
+    if missing:
+        print(f"No such projects: {', '.join(missing)}")
+
 def compact_freeze(args):
     distributions = set(distribution.name for distribution in importlib.metadata.distributions())
     versions = {distribution.name: distribution.version for distribution in importlib.metadata.distributions()}
@@ -304,20 +2541,144 @@ def compact_freeze(args):
         distributions = (f"{distribution}=={versions[distribution]}" for distribution in distributions)
     print("\n".join(distributions))
 
+def positive_int(value: str) -> int:
+    # An argparse type for job counts, which size thread pools and connection pools.
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid number: {value!r}") from None
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1: {value!r}")
+    return number
+
+def positive_seconds(value: str) -> float:
+    # An argparse type for timeouts and deadlines: zero or less would leave no time for any request.
+    try:
+        seconds = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid number of seconds: {value!r}") from None
+    if not seconds > 0:
+        raise argparse.ArgumentTypeError(f"must be more than 0 seconds: {value!r}")
+    return seconds
+
+def configure_network(args) -> None:
+    global HTTP_CACHE, TAG_INDEX_DIR, METADATA_INDEX_PATH, POOL_SIZE, MAX_RETRIES, CONNECT_TIMEOUT, READ_TIMEOUT, DEADLINE, HEDGE, TRACE, ARCHIVE
+    if getattr(args, "no_cache", False):
+        HTTP_CACHE = TAG_INDEX_DIR = METADATA_INDEX_PATH = None
+    if getattr(args, "retries", None) is not None:
+        MAX_RETRIES = max(args.retries, 0)
+    if getattr(args, "connect_timeout", None) is not None:
+        CONNECT_TIMEOUT = args.connect_timeout
+    if getattr(args, "timeout", None) is not None:
+        READ_TIMEOUT = args.timeout
+    if getattr(args, "deadline", None) is not None:
+        DEADLINE = time.monotonic() + args.deadline
+    HEDGE = getattr(args, "hedge", False) or HEDGE
+    if getattr(args, "trace", None):
+        TRACE = Trace()
+    if (archive := getattr(args, "record", None) or getattr(args, "replay", None)):
+        if getattr(args, "use_async", False):
+            raise SystemExit("pip-ext: error: --record and --replay work with the blocking engine, not with --async")
+        # Every response must come from (or go into) the archive, not from the caches.
+        HTTP_CACHE = TAG_INDEX_DIR = METADATA_INDEX_PATH = None
+        try:
+            latency = parse_host_limits(getattr(args, "replay_latency", None) or [], float, "SECONDS")
+            ARCHIVE = FixtureArchive(archive, replaying=getattr(args, "replay", None) is not None, latency=latency)
+        except ValueError as exception:
+            raise SystemExit(f"pip-ext: error: {exception}")
+    # Options override the environment (PIP_EXT_POOL_SIZE, PIP_EXT_HOST_LIMITS="host=n,host=n", PIP_EXT_HOST_RATES).
+    pool_size = getattr(args, "pool_size", None) or os.environ.get("PIP_EXT_POOL_SIZE")
+    try:
+        POOL_SIZE = int(pool_size) if pool_size else None
+        host_limits = [value for value in os.environ.get("PIP_EXT_HOST_LIMITS", "").split(",") if value.strip()]
+        HOST_LIMITS.update(parse_host_limits(host_limits + (getattr(args, "host_limits", None) or [])))
+        host_rates = [value for value in os.environ.get("PIP_EXT_HOST_RATES", "").split(",") if value.strip()]
+        HOST_RATES.update(parse_host_limits(host_rates + (getattr(args, "host_rates", None) or []), float, "REQUESTS_PER_SECOND"))
+    except ValueError as exception:
+        raise SystemExit(f"pip-ext: error: {exception}")
+
 def main() -> None:
     parser = argparse.ArgumentParser(prog="pip-ext", description="pip Additional Functionality Program")
     subparsers = parser.add_subparsers()
 
-    parser_search = subparsers.add_parser("search")
-    parser_search.add_argument("query", type=str)
+    parser_network = argparse.ArgumentParser(add_help=False)
+    parser_network.add_argument("--no-cache", dest="no_cache", action="store_true",
+                                help=f"neither read nor write the caches in {CACHE_DIR}")
+    parser_network.add_argument("--pool-size", dest="pool_size", type=int, metavar="N",
+                                help="connections kept open per host (default: the number of jobs)")
+    parser_network.add_argument("--host-limit", dest="host_limits", action="append", metavar="HOST=N",
+                                help="never open more than N connections to HOST[:PORT] at once")
+    parser_network.add_argument("--host-rate", dest="host_rates", action="append", metavar="HOST=N",
+                                help="never send more than N requests per second to HOST[:PORT]")
+    parser_network.add_argument("--retries", type=int, metavar="N",
+                                help=f"retries of a throttled or failed request (default: {MAX_RETRIES})")
+    parser_network.add_argument("--timeout", type=positive_seconds, metavar="SECONDS",
+                                help=f"give up on a response that sends nothing for this long (default: {READ_TIMEOUT:g})")
+    parser_network.add_argument("--connect-timeout", dest="connect_timeout", type=positive_seconds, metavar="SECONDS",
+                                help=f"give up on connecting after this long (default: {CONNECT_TIMEOUT:g})")
+    parser_network.add_argument("--deadline", type=positive_seconds, metavar="SECONDS",
+                                help="send no request, and stop reading responses in flight, once the command has run this long")
+    parser_network.add_argument("--hedge", action="store_true",
+                                help="send a second copy of requests that take longer than 95%% of their host's answers")
+    parser_network.add_argument("--trace", type=pathlib.Path, metavar="FILE",
+                                help="write a timeline of every fetch and parse to FILE (Chrome trace JSON) and summarize it")
+    parser_archive = parser_network.add_mutually_exclusive_group()
+    parser_archive.add_argument("--record", type=pathlib.Path, metavar="ARCHIVE",
+                                help="record every response into ARCHIVE (JSON lines), bypassing the caches")
+    parser_archive.add_argument("--replay", type=pathlib.Path, metavar="ARCHIVE",
+                                help="answer every request from ARCHIVE, offline")
+    parser_network.add_argument("--replay-latency", dest="replay_latency", action="append", metavar="HOST=SECONDS",
+                                help="delay replayed responses from HOST (* for any other host)")
+    parser_network.add_argument("--connection-stats", dest="connection_stats", action="store_true",
+                                help="report requests, connections and queueing per host on exit")
+
+    parser_search = subparsers.add_parser("search", parents=[parser_network])
+    parser_search.add_argument("query", type=str, nargs="*")
+    parser_search.add_argument("-r", "--requirement", dest="requirements", action="append", metavar="FILE",
+                               help="also search every package listed in the given requirements file")
+    parser_search.add_argument("-j", "--jobs", type=positive_int, default=8,
+                               help="number of packages looked up concurrently (connections with --async)")
+    parser_search.add_argument("--async", dest="use_async", action="store_true",
+                               help="run the lookups on the asyncio engine (requires aiohttp)")
     parser_search.add_argument("-v", "--version", type=str)
+    parser_search.add_argument("--backend", choices=("json", "html"), default="json",
+                               help="metadata source; the HTML project page is used as a fallback")
+    parser_search.add_argument("--tree", dest="tree", action="store_true",
+                               help="print the transitive dependency tree instead (a query may be a requirement, e.g. 'pkg[extra]>=1')")
+    parser_search.add_argument("--depth", type=int, default=None, help="with --tree, stop after this many levels")
+    parser_search.add_argument("--format", choices=("text", "json"), default="text", help="output format of --tree")
     parser_search.set_defaults(func=search)
 
-    parser_careful_install = subparsers.add_parser("careful-install") # or careful-install ?
+    parser_resolve = subparsers.add_parser("resolve", parents=[parser_network],
+                                           help="pin a consistent set of versions satisfying the requirements")
+    parser_resolve.add_argument("requirement_specifiers", type=str, nargs="*")
+    parser_resolve.add_argument("-r", "--requirement", dest="requirements", action="append", metavar="FILE",
+                                help="also resolve every requirement listed in the given requirements file")
+    parser_resolve.add_argument("-j", "--jobs", type=positive_int, default=16, help="number of connections")
+    parser_resolve.add_argument("--max-rounds", dest="max_rounds", type=int, default=10000,
+                                help="give up after trying this many candidate versions")
+    parser_resolve.set_defaults(func=resolve)
+
+    parser_careful_install = subparsers.add_parser("careful-install", parents=[parser_network]) # or careful-install ?
     parser_careful_install.add_argument("requirement_specifier", type=str)
     parser_careful_install.add_argument("--verbose", dest="verbose", action="store_true")
     parser_careful_install.set_defaults(func=careful_install)
 
+    parser_index = subparsers.add_parser("index")
+    subparsers_index = parser_index.add_subparsers(dest="index_command", metavar="{build,sync}", required=True)
+
+    parser_index_build = subparsers_index.add_parser("build", parents=[parser_network],
+                                                     help="download every project name for offline 'did you mean'")
+    parser_index_build.set_defaults(func=index_build)
+
+    parser_index_sync = subparsers_index.add_parser("sync", parents=[parser_network],
+                                                    help="incrementally update the local mirror of the simple index")
+    parser_index_sync.add_argument("projects", type=str, nargs="*",
+                                   help="also mirror the file listings of these projects")
+    parser_index_sync.add_argument("-j", "--jobs", type=positive_int, default=8,
+                                   help="number of project pages fetched concurrently")
+    parser_index_sync.set_defaults(func=index_sync)
+
     parser_compact_freeze = subparsers.add_parser("compact-freeze") # or compact-freeze ?
     parser_compact_freeze.add_argument("--no-version", dest="no_version", action="store_true")
     parser_compact_freeze.set_defaults(func=compact_freeze)
@@ -332,9 +2693,17 @@ def main() -> None:
     ...
 
     args = parser.parse_args()
+    configure_network(args)
 
     if True:
-        args.func(args)
+        try:
+            args.func(args)
+        finally:
+            if getattr(args, "connection_stats", False):
+                print(format_connection_stats(), file=sys.stderr)
+            if TRACE is not None:
+                TRACE.export(args.trace)
+                print(f"{TRACE.summary()}\nTrace written to {args.trace}", file=sys.stderr)
     else:
         parser.print_usage()
 
@@ -0,0 +1,41 @@
+import asyncio
+import pathlib
+import sys
+
+import pytest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "benchmarks"))
+
+from fixtures import FixtureServer # noqa: E402 (also puts the repository on sys.path)
+
+import pip_ext # noqa: E402
+
+
+@pytest.fixture
+def server(monkeypatch, tmp_path):
+    # An empty stand-in for PyPI: tests add the routes they need, nothing is cached or mirrored.
+    with FixtureServer({}) as server:
+        monkeypatch.setattr(pip_ext, "PYPI_URL", server.url)
+        monkeypatch.setattr(pip_ext, "HTTP_CACHE", None)
+        monkeypatch.setattr(pip_ext, "INDEX_PATH", tmp_path / "missing.sqlite3")
+        monkeypatch.setattr(pip_ext, "TAG_INDEX_DIR", None)
+        monkeypatch.setattr(pip_ext, "METADATA_INDEX_PATH", None)
+        yield server
+
+
+@pytest.fixture(params=["threads", "asyncio"])
+def run(request):
+    # Drives sans-IO steps with one engine or the other, so every test covers both.
+    if request.param == "asyncio" and pip_ext.aiohttp is None:
+        pytest.skip("aiohttp is not installed")
+
+    def run(steps):
+        if request.param == "threads":
+            with pip_ext.make_session() as session:
+                return pip_ext.run_steps(session, steps)
+
+        async def run_async():
+            async with pip_ext.make_client() as client:
+                return await pip_ext.run_steps_async(client, steps)
+        return asyncio.run(run_async())
+    return run
@@ -0,0 +1,21 @@
+import time
+
+import pytest
+
+import pip_ext
+
+
+def test_deadline_cuts_a_streamed_body_short(server, monkeypatch):
+    # Every read is quick, so only the deadline can stop a body that is consumed slowly.
+    server.routes["/sdist.tar.gz"] = 200, {"Content-Type": "application/gzip"}, b"\0" * (4 * 1024 * 1024)
+    chunks = []
+
+    def consume(chunk: bytes) -> bool:
+        chunks.append(chunk)
+        time.sleep(0.01)
+        return False
+
+    monkeypatch.setattr(pip_ext, "DEADLINE", time.monotonic() + 0.2)
+    with pip_ext.make_session() as session, pytest.raises(pip_ext.DeadlineExceeded):
+        pip_ext.run_steps(session, (lambda: (yield pip_ext.Get(server.url + "/sdist.tar.gz", consumer=consume)))())
+    assert 0 < len(chunks) < 4 * 1024 * 1024 // pip_ext.STREAM_CHUNK_SIZE
@@ -0,0 +1,95 @@
+import pytest
+import requests
+
+from fixtures import html_route, json_route
+
+import pip_ext
+
+INFO = {"name": "demo", "version": "1.0.0", "summary": "A demo package.", "license": "MIT",
+        "author": "Demo Author", "author_email": "author@example.org", "requires_python": ">=3.8",
+        "home_page": "https://example.org/demo", "classifiers": [],
+        "project_urls": {"Source": "https://github.com/demo/demo"}}
+
+PROJECT_PAGE = """<html><body>
+<h1 class="package-header__name">
+  demo 1.0.0
+</h1>
+<p class="package-header__date">Released: <time datetime="2024-01-01T00:00:00+0000">Jan 1, 2024</time></p>
+<p class="package-description__summary">A demo package.</p>
+<h3>Project links</h3>
+<ul>
+<li><a href="https://example.org/demo">Homepage</a></li>
+<li><a href="https://github.com/demo/demo">Source</a></li>
+</ul>
+<p><strong>License:</strong> MIT</p>
+<p><strong>Author:</strong> <a href="mailto:author@example.org">Demo Author</a></p>
+<p><strong>Requires:</strong> Python &gt;=3.8</p>
+<div class="project-description"><p>The README.</p></div>
+</body></html>
+"""
+
+LINKS = [("Homepage", "https://example.org/demo"), ("Source", "https://github.com/demo/demo")]
+
+
+def test_json_backend(server, run):
+    server.routes["/pypi/demo/json"] = json_route({"info": INFO, "urls": []})
+    package = run(pip_ext.fetch_package_steps("demo", None, "json"))
+    assert package == {"Name": "demo", "Version": "1.0.0", "Summary": "A demo package.", "License": "MIT",
+                       "Author-email": "mailto:author@example.org", "Author": "Demo Author",
+                       "Requires": "Python >=3.8", "Links": LINKS}
+    assert server.paths == ["/pypi/demo/json"]
+
+
+def test_json_backend_with_version(server, run):
+    server.routes["/pypi/demo/0.9/json"] = json_route({"info": {**INFO, "version": "0.9"}, "urls": []})
+    package = run(pip_ext.fetch_package_steps("demo", "0.9", "json"))
+    assert package["Version"] == "0.9"
+
+
+def test_html_backend(server, run):
+    server.routes["/project/demo/"] = html_route(PROJECT_PAGE)
+    package = run(pip_ext.fetch_package_steps("demo", None, "html"))
+    assert package.items() >= {"Name": "demo", "Version": "1.0.0", "Summary": "A demo package.", "Links": LINKS,
+                               "Author-email": "mailto:author@example.org", "Author": "Demo Author",
+                               "Requires": "Python >=3.8"}.items()
+    assert server.paths == ["/project/demo/"]
+
+
+def test_whitespace_license_uses_classifiers(server, run):
+    info = {**INFO, "license": " \n", "classifiers": ["License :: OSI Approved :: MIT License"]}
+    server.routes["/pypi/demo/json"] = json_route({"info": info, "urls": []})
+    assert run(pip_ext.fetch_package_steps("demo", None, "json"))["License"] == "MIT License"
+
+
+def fallback(server, run, json_answer) -> dict | None:
+    server.routes["/pypi/demo/json"] = json_answer
+    server.routes["/project/demo/"] = html_route(PROJECT_PAGE)
+    package = run(pip_ext.fetch_package_steps("demo", None, "json"))
+    assert server.paths == ["/pypi/demo/json", "/project/demo/"]
+    return package
+
+
+def test_fallback_on_malformed_json(server, run):
+    assert fallback(server, run, (200, {"Content-Type": "application/json"}, b"{\"info\": "))["Links"] == LINKS
+
+
+def test_fallback_on_incomplete_json(server, run):
+    assert fallback(server, run, json_route({"info": {"summary": "no name"}}))["Name"] == "demo"
+
+
+def test_fallback_on_absent_json(server, run):
+    assert fallback(server, run, (404, {"Content-Type": "application/json"}, b"{\"message\": \"Not Found\"}"))["Name"] == "demo"
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_no_fallback_when_throttled(server, run, monkeypatch, status):
+    monkeypatch.setattr(pip_ext, "MAX_RETRIES", 0)
+    server.routes["/pypi/demo/json"] = html_route("<html><body>Slow down</body></html>", status)
+    server.routes["/project/demo/"] = html_route(PROJECT_PAGE)
+    with pytest.raises(requests.HTTPError):
+        run(pip_ext.fetch_package_steps("demo", None, "json"))
+    assert server.paths == ["/pypi/demo/json"]
+
+
+def test_missing_project(server, run):
+    assert run(pip_ext.fetch_package_steps("demo", None, "json")) is None
@@ -0,0 +1,46 @@
+import pip_ext
+
+
+def pkt_lines(*lines: bytes) -> bytes:
+    # Each pkt-line starts with its own length, four hex digits included; "0000" is a flush.
+    return b"".join(b"0000" if line is None else b"%04x" % (len(line) + 4) + line for line in lines)
+
+
+HEAD, LIGHT, TAG_OBJECT, TAGGED = "a" * 40, "b" * 40, "c" * 40, "d" * 40
+
+ADVERTISEMENT = pkt_lines(
+    b"# service=git-upload-pack\n",
+    None,
+    f"{HEAD} HEAD\0multi_ack symref=HEAD:refs/heads/main agent=git/2.43\n".encode(),
+    f"{HEAD} refs/heads/main\n".encode(),
+    f"{LIGHT} refs/tags/v1.0\n".encode(),
+    f"{TAG_OBJECT} refs/tags/v2.0\n".encode(),
+    f"{TAGGED} refs/tags/v2.0^{{}}\n".encode(),
+    None,
+)
+
+
+def test_parse_ref_advertisement_peels_annotated_tags():
+    refs = pip_ext.parse_ref_advertisement(ADVERTISEMENT)
+    assert refs.head == HEAD and refs.branch == "main"
+    # v2.0 is an annotated tag: the commit it points at, not the tag object, is kept.
+    assert refs.tags == {"v1.0": LIGHT, "v2.0": TAGGED}
+
+
+def test_find_tag():
+    tags = dict.fromkeys(["v1.0", "2.0", "release-3.0", "mypkg-4.0", "my_pkg_5.0", "other-1.10", "build-6.0"], HEAD)
+    assert pip_ext.find_tag(tags, "1.0") == "v1.0"
+    assert pip_ext.find_tag(tags, "2.0") == "2.0"
+    assert pip_ext.find_tag(tags, "3.0") == "release-3.0"
+    assert pip_ext.find_tag(tags, "4.0", "MyPkg") == "mypkg-4.0"
+    assert pip_ext.find_tag(tags, "5.0", "my_pkg") == "my_pkg_5.0"
+    assert pip_ext.find_tag(tags, "6.0") == "build-6.0" # any tag that ends in the version
+    assert pip_ext.find_tag(tags, "1.1") is None # not "other-1.10"
+    assert pip_ext.find_tag(tags, "0") is None # not "v1.0"
+
+
+def test_tag_index_keeps_the_latest_commit(tmp_path):
+    path = tmp_path / "github.com" / "owner" / "repo.jsonl"
+    assert pip_ext.TagIndex(path).update({"v1.0": LIGHT, "v2.0": TAG_OBJECT}) == 2
+    assert pip_ext.TagIndex(path).update({"v1.0": LIGHT, "v2.0": TAGGED}) == 1
+    assert pip_ext.TagIndex(path).tags == {"v1.0": LIGHT, "v2.0": TAGGED}
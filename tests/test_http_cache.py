@@ -0,0 +1,41 @@
+import pytest
+
+import pip_ext
+
+
+@pytest.fixture
+def cache(server, monkeypatch, tmp_path):
+    monkeypatch.setattr(pip_ext, "HTTP_CACHE", pip_ext.HTTPCache(tmp_path / "http"))
+
+
+def get_steps(url: str):
+    response = yield pip_ext.Get(url)
+    return response.status_code, response.content
+
+
+@pytest.mark.parametrize("validator", [{"ETag": '"v1"'}, {"Last-Modified": "Wed, 14 Oct 2026 07:28:00 GMT"}])
+def test_revalidated_entry_is_served_from_the_cache(server, run, cache, validator):
+    # Without a freshness lifetime every use is revalidated. The route's body changes but its
+    # validator does not, so only the 304 path can still answer with the first body.
+    server.routes["/page"] = 200, {"Content-Type": "text/plain", **validator}, b"first"
+    assert run(get_steps(server.url + "/page")) == (200, b"first")
+    server.routes["/page"] = 200, {"Content-Type": "text/plain", **validator}, b"second"
+    assert run(get_steps(server.url + "/page")) == (200, b"first")
+    assert run(get_steps(server.url + "/page")) == (200, b"first")
+    assert len(server.paths) == 3
+
+
+def test_changed_validator_replaces_the_entry(server, run, cache):
+    server.routes["/page"] = 200, {"ETag": '"v1"'}, b"first"
+    assert run(get_steps(server.url + "/page")) == (200, b"first")
+    server.routes["/page"] = 200, {"ETag": '"v2"'}, b"second"
+    assert run(get_steps(server.url + "/page")) == (200, b"second")
+    server.routes["/page"] = 200, {"ETag": '"v2"'}, b"third"
+    assert run(get_steps(server.url + "/page")) == (200, b"second")
+
+
+def test_fresh_entry_is_not_revalidated(server, run, cache):
+    server.routes["/page"] = 200, {"Cache-Control": "max-age=600", "ETag": '"v1"'}, b"first"
+    assert run(get_steps(server.url + "/page")) == (200, b"first")
+    assert run(get_steps(server.url + "/page")) == (200, b"first")
+    assert len(server.paths) == 1
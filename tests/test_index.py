@@ -0,0 +1,25 @@
+import array
+
+import pip_ext
+
+
+def postings(index: pip_ext.SimpleIndexMirror) -> dict[str, list[str]]:
+    names = dict(index.connection.execute("SELECT id, normalized FROM projects"))
+    return {key: sorted(names.get(id_, f"#{id_}") for id_ in array.array("I", ids))
+            for key, ids in index.connection.execute("SELECT trigram, ids FROM trigrams")}
+
+
+def test_sync_drops_the_postings_of_removed_projects(tmp_path):
+    index = pip_ext.SimpleIndexMirror(tmp_path / "index.sqlite3")
+    index.replace_projects({"numpy": 1, "requests": 2, "zzzz": 3}, serial="3")
+    index.update_projects({"numpy": 1, "requests": 2, "pandas": 4}, serial="4")
+    # pandas takes the id zzzz had: no posting may still lead to it from zzzz's trigrams.
+    assert all(all(key[:3] in f"^{name}$" for name in names) for key, names in postings(index).items())
+    assert not any(key.startswith("zzz") for key in postings(index))
+    assert index.closest("pandsa") == "pandas"
+    assert index.closest("zzzz") is None
+
+    index.update_projects({"numpy": 1, "pandas": 4}, serial="5")
+    fresh = pip_ext.SimpleIndexMirror(tmp_path / "fresh.sqlite3")
+    fresh.replace_projects({"numpy": 1, "pandas": 4}, serial="5")
+    assert postings(index) == postings(fresh)
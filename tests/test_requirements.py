@@ -0,0 +1,33 @@
+from fixtures import pypi_routes
+
+import pip_ext
+
+REQUIREMENTS = """\
+# This file is autogenerated by pip-compile
+--index-url https://pypi.org/simple
+certifi==2024.2.2 \\
+    --hash=sha256:0569859f95fc761b18b45ef421b1290a0f65f147e92a1e5eb3e635f9a5e4e66f \\
+    --hash=sha256:dc383c07b76109f368f6106eee2b593b04a011ea4d55f652c6ca24a754d1cdd1
+    # via requests
+requests==2.31.0 --hash=sha256:58cd2187c01e70e6e26505bca751777aa9f2ee0b7f4300988b709f44e013003f
+colorama==0.4.6 ; sys_platform == "never"
+tomli>=1.1 ; python_version >= "3"  # a comment
+-e ./local
+not a requirement
+"""
+
+
+def test_read_requirements(tmp_path):
+    path = tmp_path / "requirements.txt"
+    path.write_text(REQUIREMENTS, encoding="utf-8")
+    assert pip_ext.read_requirements(path) == ["certifi==2024.2.2", "requests==2.31.0",
+                                               "tomli>=1.1 ; python_version >= \"3\"", "not a requirement"]
+
+
+def test_invalid_query_fails_alone(server, run):
+    routes, names = pypi_routes(2)
+    server.routes.update(routes)
+    results = [run(pip_ext.safe_lookup_steps(query, None)) for query in (names[0], "not a requirement", f"{names[1]}==1.0.0")]
+    assert results[0].startswith("Name: package-0")
+    assert results[1].startswith("Invalid requirement 'not a requirement'")
+    assert results[2] == "No such project named 'package-1' with version '1.0.0' was found."
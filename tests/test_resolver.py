@@ -0,0 +1,55 @@
+from bench_tree import tree_routes
+from packaging.requirements import Requirement
+
+import pip_ext
+
+
+def resolve(server, run, projects: dict, *requirements: str) -> tuple[dict | None, pip_ext.Resolver]:
+    # `projects` maps each name to its releases and their Requires-Dist lines, served as
+    # PEP 691 project pages with PEP 658 metadata files.
+    server.routes.update(tree_routes({"projects": projects}, server.url))
+    resolver = pip_ext.Resolver(pip_ext.MetadataIndex(None))
+    return run(resolver.resolve_steps([Requirement(requirement) for requirement in requirements])), resolver
+
+
+def test_newest_versions(server, run):
+    pins, resolver = resolve(server, run, {"app": {"1.0": ["lib>=1"], "2.0": ["lib>=2"]}, "lib": {"1.0": [], "2.0": [], "3.0": []}}, "app")
+    assert pins == {"app": "2.0", "lib": "3.0"}
+    assert resolver.stats["backtracks"] == 0
+
+
+def test_backtracking(server, run):
+    # lib 2.0 is tried first; plugin then needs lib<2, so the choice of lib is undone.
+    projects = {"app": {"1.0": ["lib", "plugin"]}, "lib": {"1.0": [], "2.0": []}, "plugin": {"1.0": ["lib<2"]}}
+    pins, resolver = resolve(server, run, projects, "app")
+    assert pins == {"app": "1.0", "lib": "1.0", "plugin": "1.0"}
+    assert resolver.stats["backtracks"] >= 1
+
+
+def test_unsatisfiable(server, run):
+    projects = {"app": {"1.0": ["lib>=3", "plugin"]}, "lib": {"1.0": [], "3.0": []}, "plugin": {"1.0": ["lib<2"]}}
+    pins, resolver = resolve(server, run, projects, "app")
+    assert pins is None
+    assert resolver.conflicts["lib"] >= 1
+
+
+def test_missing_project(server, run):
+    pins, resolver = resolve(server, run, {"app": {"1.0": ["does-not-exist"]}}, "app")
+    assert pins is None
+    assert resolver.conflicts["does-not-exist"] == 1
+
+
+def test_extras_and_markers(server, run):
+    projects = {"app": {"1.0": ["lib[fast]", "winonly; sys_platform == 'never'"]},
+                "lib": {"1.0": ["speedup; extra == 'fast'", "other; extra == 'slow'"]},
+                "speedup": {"1.0": []}, "other": {"1.0": []}, "winonly": {"1.0": []}, "tool": {"1.0": []}}
+    pins, _ = resolve(server, run, projects, "app", "tool; sys_platform == 'never'")
+    assert pins == {"app": "1.0", "lib": "1.0", "speedup": "1.0"}
+
+
+def test_extra_added_to_a_pinned_project(server, run):
+    # lib is pinned without extras first; a later requirement on lib[fast] adds speedup.
+    projects = {"app": {"1.0": ["lib", "plugin"]}, "plugin": {"1.0": ["lib[fast]"]},
+                "lib": {"1.0": ["speedup; extra == 'fast'"]}, "speedup": {"1.0": []}}
+    pins, _ = resolve(server, run, projects, "app")
+    assert pins == {"app": "1.0", "lib": "1.0", "plugin": "1.0", "speedup": "1.0"}
@@ -0,0 +1,58 @@
+import gzip
+import io
+import tarfile
+
+import pytest
+
+import pip_ext
+
+LONG = "a-project-with-a-rather-long-name-" + "x" * 80 + "-1.0" # over the 100 bytes of a tar name field
+
+
+def sdist(root: str, files: dict[str, str], format: int = tarfile.PAX_FORMAT) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w", format=format) as tar:
+        for name, content in files.items():
+            data = content.encode("utf-8")
+            info = tarfile.TarInfo(f"{root}/{name}")
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return gzip.compress(buffer.getvalue())
+
+
+def scan(archive: bytes, chunk_size: int = 1000) -> pip_ext.SdistScanner:
+    scanner = pip_ext.SdistScanner()
+    for position in range(0, len(archive), chunk_size):
+        if scanner.feed(archive[position:position + chunk_size]):
+            break
+    return scanner
+
+
+@pytest.mark.parametrize("format", [tarfile.GNU_FORMAT, tarfile.PAX_FORMAT])
+def test_long_member_names(format):
+    archive = sdist(LONG, {"README.rst": "x" * 5000, "setup.cfg": "[options]\ninstall_requires =\n    requests >= 2.0\n"}, format)
+    assert scan(archive).dependencies() == ({"requests >= 2.0"}, set())
+
+
+def test_only_top_level_files_are_kept():
+    archive = sdist("example-1.0", {"tests/pyproject.toml": '[project]\ndependencies = ["wrong"]\n',
+                                    "pyproject.toml": '[project]\nname = "example"\ndependencies = ["right"]\n',
+                                    "setup.py": "setup(install_requires=['unread'])\n"})
+    scanner = scan(archive, chunk_size=100)
+    assert scanner.done and "setup.py" not in scanner.files # static dependencies settle the scan
+    assert scanner.dependencies() == ({"right"}, set())
+
+
+def test_pyproject_takes_precedence_over_setup_files():
+    archive = sdist("example-1.0", {"setup.py": "setup(install_requires=['from-setup-py'])\n",
+                                    "setup.cfg": "[options]\ninstall_requires = from-setup-cfg\n",
+                                    "pyproject.toml": '[project]\nname = "example"\ndynamic = ["dependencies"]\n'})
+    assert scan(archive).dependencies() == ({"from-setup-cfg"}, set())
+    archive = sdist("example-1.0", {"pyproject.toml": '[project]\ndependencies = ["from-pyproject"]\n',
+                                    "setup.cfg": "[options]\ninstall_requires = from-setup-cfg\n"})
+    assert scan(archive).dependencies() == ({"from-pyproject"}, set())
+
+
+def test_uncompressed_archive():
+    archive = gzip.decompress(sdist("example-1.0", {"setup.py": "setup(install_requires=['six'])\n"}))
+    assert scan(archive).dependencies() == ({"six"}, set())
@@ -0,0 +1,46 @@
+import pip_ext
+
+SETUP_PY = """\
+from setuptools import setup
+
+BASE: list[str] = ["requests>=2.0", "click"]
+REQUIRES = BASE + ["rich"]
+REQUIRES += ["tomli; python_version < '3.11'"]
+VERSION = get_version() # computed: not static, and not needed either
+EXTRAS = {
+    "socks": ["PySocks"],
+    "socks:sys_platform == 'win32'": ["win-inet-pton"],
+    ":python_version < '3.8'": ["importlib-metadata"],
+}
+kwargs = dict(install_requires=REQUIRES, extras_require=EXTRAS)
+
+setup(name="example", version=VERSION, **kwargs)
+"""
+
+
+def test_constants_augmented_assignments_and_kwargs():
+    dependencies, optional = pip_ext.setup_py_dependencies(SETUP_PY)
+    assert dependencies == {"requests>=2.0", "click", "rich", "tomli; python_version < '3.11'",
+                            "importlib-metadata; python_version < '3.8'"}
+    assert optional == {("socks", ("PySocks", "win-inet-pton; sys_platform == 'win32'"))}
+
+
+def test_kwargs_dict_literal_and_requirement_string():
+    content = 'import setuptools\nsetuptools.setup(**{"install_requires": """\n  six  # compat\n  attrs>=20\n"""})\n'
+    assert pip_ext.setup_py_dependencies(content) == ({"six", "attrs>=20"}, set())
+
+
+def test_marker_key_joins_a_requirement_marker():
+    content = 'setup(extras_require={"fast:sys_platform != \'win32\'": ["uvloop; python_version >= \'3.8\'"]})'
+    _, optional = pip_ext.setup_py_dependencies(content)
+    assert optional == {("fast", ("uvloop; (python_version >= '3.8') and (sys_platform != 'win32')",))}
+
+
+def test_reassigned_constant_is_no_longer_static():
+    content = 'REQUIRES = ["a"]\nREQUIRES = open("requirements.txt").read().split()\nsetup(install_requires=REQUIRES)\n'
+    assert pip_ext.setup_py_dependencies(content) == (set(), set())
+
+
+def test_python2_setup_py_falls_back_to_tokens():
+    content = 'print "building"\nsetup(\n    name="old",\n    install_requires=["simplejson", "six>=1.0"],\n)\n'
+    assert pip_ext.setup_py_dependencies(content) == ({"simplejson", "six>=1.0"}, set())
@@ -0,0 +1,56 @@
+import collections
+
+import pytest
+
+import pip_ext
+
+
+@pytest.fixture
+def trace(monkeypatch):
+    trace = pip_ext.Trace()
+    monkeypatch.setattr(pip_ext, "TRACE", trace)
+    return trace
+
+
+def nested(events: list[dict]) -> bool:
+    # Complete ("X") events on one lane must nest, or trace viewers draw them wrongly.
+    lanes = collections.defaultdict(list)
+    for event in events:
+        lanes[event["tid"]].append((event["ts"], event["ts"] + event["dur"]))
+    for spans in lanes.values():
+        stack = []
+        for start, end in sorted(spans, key=lambda span: (span[0], -span[1])):
+            while stack and stack[-1] <= start:
+                stack.pop()
+            if stack and end > stack[-1]:
+                return False
+            stack.append(end)
+    return True
+
+
+def stage_steps(server, path: str):
+    with pip_ext.span("lookup", "stage", path=path):
+        response = yield pip_ext.Get(server.url + path)
+        with pip_ext.span("parse", "page"):
+            return response.status_code
+
+
+def test_gathered_steps_get_lanes_of_their_own(server, run, trace):
+    # Driven in lockstep, the first step opens its span first and also closes it first.
+    server.routes.update({"/a": (200, {}, b"a"), "/b": (200, {}, b"b")})
+
+    def both():
+        return (yield from pip_ext.gather_steps([stage_steps(server, "/a"), stage_steps(server, "/b")]))
+    assert run(both()) == [200, 200]
+    stages = [event for event in trace.events if event["name"] == "stage"]
+    assert len(stages) == 2 and stages[0]["tid"] != stages[1]["tid"]
+    assert nested(trace.events)
+
+
+def test_error_statuses_in_summary(trace):
+    for status in (200, 304, 404, 429, 503):
+        with pip_ext.span("http", "GET example.org") as details:
+            details["status"] = status
+    with pytest.raises(ValueError), pip_ext.span("http", "GET example.org"):
+        raise ValueError("boom")
+    assert trace.summary().splitlines()[1].split()[-1] == "3"
@@ -0,0 +1,99 @@
+import io
+import random
+import struct
+import zipfile
+
+import pytest
+
+import pip_ext
+from pip_ext import ZipRecord
+
+METADATA = (b"Metadata-Version: 2.1\nName: demo\nVersion: 1.0\nRequires-Dist: requests>=2\n"
+            b"Requires-Dist: rich; extra == \"cli\"\nProvides-Extra: cli\n\nThe README.\n")
+WHEEL = "/files/demo-1.0-py3-none-any.whl"
+
+
+def make_wheel(members: list[tuple[str, bytes, int]]) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, data, compression in members:
+            archive.writestr(name, data, compress_type=compression)
+    return buffer.getvalue()
+
+
+def small_wheel() -> bytes:
+    return make_wheel([("demo/__init__.py", b"VERSION = '1.0'\n", zipfile.ZIP_DEFLATED),
+                       ("demo-1.0.dist-info/METADATA", METADATA, zipfile.ZIP_DEFLATED),
+                       ("demo-1.0.dist-info/RECORD", b"", zipfile.ZIP_DEFLATED)])
+
+
+def large_wheel() -> bytes:
+    # METADATA first, then more incompressible data than the tail read covers.
+    return make_wheel([("demo-1.0.dist-info/METADATA", METADATA, zipfile.ZIP_DEFLATED),
+                       ("demo/data.bin", random.Random(0).randbytes(256 * 1024), zipfile.ZIP_STORED),
+                       ("demo-1.0.dist-info/RECORD", b"", zipfile.ZIP_DEFLATED)])
+
+
+def zip64(data: bytes) -> bytes:
+    # Rewrites a zip the way writers do past 4 GiB: the end record and every central directory
+    # entry saturate their counts, sizes and offsets, and the real values move to zip64 records.
+    end = data.rfind(b"PK\x05\x06")
+    *_, entries, size, offset, _ = ZipRecord.END_OF_CENTRAL_DIRECTORY.unpack_from(data, end)
+    directory, position = b"", offset
+    while position < offset + size:
+        fields = list(ZipRecord.CENTRAL_DIRECTORY_ENTRY.unpack_from(data, position))
+        position += ZipRecord.CENTRAL_DIRECTORY_ENTRY.size
+        name_length, extra_length, comment_length = fields[10:13]
+        name = data[position:position + name_length]
+        extra = data[position + name_length:position + name_length + extra_length]
+        position += name_length + extra_length + comment_length
+        extra += struct.pack("<2H3Q", 0x0001, 24, fields[9], fields[8], fields[16])
+        fields[8] = fields[9] = fields[16] = 0xFFFFFFFF
+        fields[11], fields[12] = len(extra), 0
+        directory += ZipRecord.CENTRAL_DIRECTORY_ENTRY.pack(*fields) + name + extra
+    record_offset = offset + len(directory)
+    record = ZipRecord.ZIP64_END_OF_CENTRAL_DIRECTORY.pack(
+        b"PK\x06\x06", ZipRecord.ZIP64_END_OF_CENTRAL_DIRECTORY.size - 12, 45, 45, 0, 0, entries, entries, len(directory), offset)
+    locator = ZipRecord.ZIP64_LOCATOR.pack(b"PK\x06\x07", 0, record_offset, 1)
+    end_record = ZipRecord.END_OF_CENTRAL_DIRECTORY.pack(b"PK\x05\x06", 0, 0, 0xFFFF, 0xFFFF, 0xFFFFFFFF, 0xFFFFFFFF, 0)
+    return data[:offset] + directory + record + locator + end_record
+
+
+def serve(server, data: bytes) -> str:
+    server.routes[WHEEL] = 200, {"Content-Type": "application/octet-stream"}, data
+    return server.url + WHEEL
+
+
+def test_small_wheel_is_read_in_one_request(server, run):
+    assert run(pip_ext.wheel_metadata_steps(serve(server, small_wheel()))) == METADATA
+    assert len(server.paths) == 1
+
+
+def test_metadata_outside_the_tail(server, run):
+    data = large_wheel()
+    assert run(pip_ext.wheel_metadata_steps(serve(server, data))) == METADATA
+    assert len(server.paths) == 2
+
+
+def test_zip64(server, run):
+    data = zip64(large_wheel())
+    assert zipfile.ZipFile(io.BytesIO(data)).read("demo-1.0.dist-info/METADATA") == METADATA
+    assert run(pip_ext.wheel_metadata_steps(serve(server, data))) == METADATA
+    assert len(server.paths) == 2
+
+
+def test_wheel_without_metadata(server, run):
+    data = make_wheel([("demo/__init__.py", b"", zipfile.ZIP_DEFLATED)])
+    assert run(pip_ext.wheel_metadata_steps(serve(server, data))) is None
+
+
+def test_server_ignoring_range(server, run):
+    server.ranges = False
+    with pytest.raises(ValueError, match="does not support range requests"):
+        run(pip_ext.wheel_metadata_steps(serve(server, large_wheel())))
+
+
+def test_wheel_dependencies(server, run):
+    files = [{"filename": "demo-1.0-py3-none-any.whl", "url": serve(server, large_wheel())}]
+    assert run(pip_ext.wheel_dependencies_steps(files)) == pip_ext.parse_core_metadata(METADATA)
+    assert pip_ext.parse_core_metadata(METADATA)[0] == {"requests>=2"}